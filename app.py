@@ -1,13 +1,26 @@
 import os
 os.environ["IMAGEIO_FFMPEG_EXE"] = "/usr/bin/ffmpeg"
 
-from fastapi import FastAPI, UploadFile, File, Form
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi import FastAPI, UploadFile, File, Form, Request
+from fastapi.responses import JSONResponse, FileResponse, StreamingResponse, Response
 import subprocess
 import whisper
 from whisper.utils import get_writer
 from moviepy.editor import *
-import uuid, glob, random
+import proglog
+import uuid, glob, random, hashlib, json, re, shutil, zipfile
+import time, threading, io
+from typing import List
+import math, asyncio, functools, multiprocessing, heapq, itertools, bisect
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from starlette.concurrency import run_in_threadpool
+from starlette.background import BackgroundTask
+import numpy as np
+import cv2
+import torch
+from PIL import Image
 
 app = FastAPI(
     title="FFmpeg + Whisper API",
@@ -20,202 +33,3890 @@ app = FastAPI(
 # ======================
 UPLOAD_DIR = "/workspace/uploads"
 OUTPUT_DIR = "/workspace/output"
+CACHE_DIR = "/workspace/cache"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 os.makedirs(OUTPUT_DIR, exist_ok=True)
+os.makedirs(CACHE_DIR, exist_ok=True)
+
+# Orçamento de memória para modelos Whisper mantidos carregados (MB)
+WHISPER_CACHE_MB = int(os.environ.get("WHISPER_CACHE_MB", "8192"))
+
+# Tamanho dos pools de execução (um por classe de carga)
+WHISPER_WORKERS = int(os.environ.get("WHISPER_WORKERS", "1"))
+FFMPEG_WORKERS = int(os.environ.get("FFMPEG_WORKERS", "4"))
+RENDER_WORKERS = int(os.environ.get("RENDER_WORKERS", "2"))
+# Cada worker "spawn" reimporta o app.py inteiro (torch, whisper, moviepy...):
+# centenas de MB por processo antes do primeiro frame, então o padrão é modesto
+SEGMENT_WORKERS = int(os.environ.get("SEGMENT_WORKERS", str(min(os.cpu_count() or 4, 4))))
+
+# Arquivos de um /whisper/batch preparados em paralelo (a inferência é serializada no modelo)
+WHISPER_BATCH_WORKERS = int(os.environ.get("WHISPER_BATCH_WORKERS", "4"))
+
+# /whisper/stream: áudio transcrito em janelas deste tamanho (segundos)
+STREAM_WINDOW_SECONDS = int(os.environ.get("STREAM_WINDOW_SECONDS", "30"))
+
+# Cota do cache de segmentos já codificados (MB)
+SEGMENT_CACHE_MB = int(os.environ.get("SEGMENT_CACHE_MB", "20480"))
+
+# Cota do cache de áudio decodificado para o Whisper (PCM 16 kHz, MB)
+PCM_CACHE_MB = int(os.environ.get("PCM_CACHE_MB", "10240"))
+
+# Cota do cache de transcrições prontas (JSON, MB)
+TRANSCRIPT_CACHE_MB = int(os.environ.get("TRANSCRIPT_CACHE_MB", "1024"))
+
+# Renders simultâneos (o resto espera na fila) e jobs finalizados mantidos em memória
+MAX_CONCURRENT_RENDERS = int(os.environ.get("MAX_CONCURRENT_RENDERS", str(RENDER_WORKERS)))
+JOB_HISTORY = int(os.environ.get("JOB_HISTORY", "200"))
+
+# Intervalo entre linhas de progresso dos encodes no log (segundos)
+PROGRESS_LOG_SECONDS = int(os.environ.get("PROGRESS_LOG_SECONDS", "10"))
+
+# Uploads: gravados em blocos, com limite de tamanho
+MAX_UPLOAD_MB = int(os.environ.get("MAX_UPLOAD_MB", "4096"))
+MAX_UPLOAD_BYTES = MAX_UPLOAD_MB * 2**20
+UPLOAD_CHUNK_BYTES = 1 * 2**20
+
+
+# ========================
+# 🧵 POOLS DE EXECUÇÃO (trabalho bloqueante fora do event loop)
+# ========================
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def _create_pool(kind):
+    if kind == "whisper":
+        # Threads: o modelo fica no registro deste processo
+        return ThreadPoolExecutor(WHISPER_WORKERS, thread_name_prefix="whisper")
+    if kind == "ffmpeg":
+        # Threads: o trabalho pesado acontece no subprocesso do ffmpeg
+        return ThreadPoolExecutor(FFMPEG_WORKERS, thread_name_prefix="ffmpeg")
+    if kind == "render":
+        # Processos: geração de frames em Python (MoviePy/PIL) segura o GIL.
+        # "spawn" evita herdar o contexto CUDA do processo da API.
+        return ProcessPoolExecutor(RENDER_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    if kind == "segment":
+        # Processos: um segmento (imagem) por vez em cada worker
+        return ProcessPoolExecutor(SEGMENT_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    raise ValueError(f"Pool desconhecido: {kind}")
+
+
+def get_pool(kind):
+    with _pools_lock:
+        if kind not in _pools:
+            _pools[kind] = _create_pool(kind)
+        return _pools[kind]
+
+
+def discard_pool(kind, pool):
+    """
+    Tira do registro um pool de processos quebrado (um worker morreu, ex.: OOM
+    kill): a próxima chamada de get_pool cria um novo em vez de falhar para sempre.
+    """
+    with _pools_lock:
+        if _pools.get(kind) is not pool:
+            return  # outro job já trocou o pool
+        del _pools[kind]
+    pool.shutdown(wait=False, cancel_futures=True)
+    print(f"♻️ Pool {kind} quebrado (worker morto): será recriado")
+
+
+def submit_to_pool(kind, fn, *args, **kwargs):
+    """
+    pool.submit no pool indicado; se ele já estava quebrado, recria e envia de
+    novo (o job que derrubou o worker foi outro). Retorna (pool, future).
+    """
+    pool = get_pool(kind)
+    try:
+        return pool, pool.submit(fn, *args, **kwargs)
+    except BrokenProcessPool:
+        discard_pool(kind, pool)
+        pool = get_pool(kind)
+        return pool, pool.submit(fn, *args, **kwargs)
+
+
+async def run_in_pool(kind, fn, *args, **kwargs):
+    """
+    Executa fn(*args, **kwargs) no pool indicado sem bloquear o event loop.
+    """
+    pool, future = submit_to_pool(kind, fn, *args, **kwargs)
+    try:
+        return await asyncio.wrap_future(future)
+    except BrokenProcessPool:
+        # O worker morreu durante este job: o erro sobe, o pool é recriado
+        discard_pool(kind, pool)
+        raise
+
+
+@app.on_event("shutdown")
+def shutdown_pools():
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.shutdown(wait=False, cancel_futures=True)
+        _pools.clear()
+    if _progress_manager is not None:
+        _progress_manager.shutdown()
+
+
+# ========================
+# 📋 JOBS DE RENDER (fila com prioridade e concorrência limitada)
+# ========================
+_progress_manager = None
+_progress_lock = threading.Lock()
+
+
+def progress_store():
+    """
+    Dict compartilhado entre processos onde os renders publicam o progresso.
+    O Manager só é iniciado no primeiro job.
+    """
+    global _progress_manager
+    with _progress_lock:
+        if _progress_manager is None:
+            _progress_manager = multiprocessing.get_context("spawn").Manager()
+            _progress_manager.store = _progress_manager.dict()
+        return _progress_manager.store
+
+
+class ProgressReporter:
+    """
+    Publica o progresso de um job no dict compartilhado. É picklable, então
+    vai junto com a chamada para o pool de render.
+    """
+
+    def __init__(self, store, job_id):
+        self.store = store
+        self.job_id = job_id
+
+    def __call__(self, fraction, stage, **extra):
+        try:
+            self.store[self.job_id] = {
+                "fraction": round(min(max(fraction, 0.0), 1.0), 4),
+                "stage": stage,
+                "updated_at": time.time(),
+                **extra,
+            }
+        except Exception:
+            # Progresso é informativo: nunca derruba o render
+            pass
+
+
+class EncodeProgress:
+    """
+    Métricas de um encode em andamento: frames, fps do encode, velocidade em
+    relação ao tempo real, bitrate e ETA. Publica no job (progress) e, a cada
+    PROGRESS_LOG_SECONDS, no log. A fração do job vai de base a base + span.
+    """
+
+    def __init__(self, progress=None, label="encode", duration=None, fps=None, stage="encode",
+                 base=0.0, span=1.0, output_path=None):
+        self.progress = progress
+        self.label = label
+        self.duration = duration
+        self.fps = fps
+        self.stage = stage
+        self.base = base
+        self.span = span
+        self.output_path = output_path
+        self.start = time.perf_counter()
+        self.stats = {}
+        self._last = {}
+        self._last_report = 0.0
+        self._last_log = self.start
+
+    def update(self, frames=None, media_time=None, size_bytes=None, bitrate_kbps=None, final=False):
+        self._last = dict(frames=frames, media_time=media_time, size_bytes=size_bytes, bitrate_kbps=bitrate_kbps)
+        now = time.perf_counter()
+        if not final and now - self._last_report < 0.5:
+            return
+        self._last_report = now
+
+        elapsed = max(now - self.start, 1e-6)
+        if media_time is None and frames is not None and self.fps:
+            media_time = frames / self.fps
+        if size_bytes is None and self.output_path and os.path.exists(self.output_path):
+            size_bytes = os.path.getsize(self.output_path)
+
+        stats = {"elapsed_seconds": round(elapsed, 1)}
+        if frames is not None:
+            stats["frames"] = frames
+            stats["encode_fps"] = round(frames / elapsed, 2)
+        fraction = 0.0
+        if media_time is not None:
+            speed = media_time / elapsed
+            stats["media_seconds"] = round(media_time, 2)
+            stats["speed"] = round(speed, 3)
+            if bitrate_kbps is None and size_bytes and media_time > 0:
+                bitrate_kbps = size_bytes * 8 / media_time / 1000
+            if self.duration:
+                fraction = min(media_time / self.duration, 1.0)
+                remaining = max(self.duration - media_time, 0.0)
+                stats["eta_seconds"] = round(remaining / speed, 1) if speed > 0 else None
+        if bitrate_kbps is not None:
+            stats["bitrate_kbps"] = round(bitrate_kbps, 1)
+        self.stats = stats
+
+        if self.progress:
+            self.progress(self.base + self.span * (1.0 if final else fraction), self.stage, **stats)
+        if final or now - self._last_log >= PROGRESS_LOG_SECONDS:
+            self._last_log = now
+            parts = [f"{k}={v}" for k, v in stats.items()]
+            print(f"[{self.label}] {self.stage} {100 * fraction:.1f}% " + " ".join(parts))
+
+    def finish(self):
+        self.update(**self._last, final=True)
+        return self.stats
+
+
+class FfmpegProgressParser:
+    """
+    Lê a saída de -progress do ffmpeg (blocos key=value terminados em
+    progress=continue/end) e repassa ao EncodeProgress.
+    """
+
+    KEYS = {"frame", "fps", "bitrate", "total_size", "out_time_us", "out_time_ms", "out_time",
+            "speed", "progress", "dup_frames", "drop_frames", "stream_0_0_q"}
+
+    def __init__(self, tracker):
+        self.tracker = tracker
+        self.block = {}
+
+    def feed(self, line):
+        """
+        Consome uma linha; False se ela não for do -progress (ex.: erro no stderr).
+        """
+        key, sep, value = line.strip().partition("=")
+        if not sep or (key not in self.KEYS and not key.startswith("stream_")):
+            return False
+        self.block[key] = value.strip()
+        if key == "progress":
+            block, self.block = self.block, {}
+            frames = block.get("frame", "")
+            out_time = block.get("out_time_us") or block.get("out_time_ms")  # os dois vêm em µs
+            size = block.get("total_size", "")
+            bitrate = block.get("bitrate", "").removesuffix("kbits/s")
+            self.tracker.update(
+                frames=int(frames) if frames.isdigit() else None,
+                media_time=int(out_time) / 1e6 if out_time and out_time.lstrip("-").isdigit() and int(out_time) >= 0 else None,
+                size_bytes=int(size) if size.isdigit() else None,
+                bitrate_kbps=float(bitrate) if re.fullmatch(r"[0-9.]+", bitrate) else None,
+                final=value.strip() == "end"
+            )
+        return True
+
+
+class MoviePyProgressLogger(proglog.ProgressBarLogger):
+    """
+    Logger para o write_videofile: cada frame da barra "t" (vídeo) vira uma
+    atualização do EncodeProgress.
+    """
+
+    def __init__(self, tracker):
+        super().__init__()
+        self.tracker = tracker
+
+    def bars_callback(self, bar, attr, value, old_value=None):
+        if bar == "t" and attr == "index":
+            self.tracker.update(frames=value + 1)
+
+
+class Job:
+    def __init__(self, kind, fn, kwargs, priority, pool="render"):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.fn = fn
+        self.pool = pool
+        self.kwargs = kwargs
+        self.priority = priority
+        self.status = "queued"
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.done = asyncio.Event()
+
+    def progress(self):
+        if self.status == "done":
+            return {"fraction": 1.0, "stage": "done"}
+        if self.status == "queued":
+            return {"fraction": 0.0, "stage": "queued"}
+        return dict(progress_store().get(self.id) or {"fraction": 0.0, "stage": self.status})
+
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "priority": self.priority,
+            "progress": self.progress(),
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+class RenderScheduler:
+    """
+    Fila de renders: no máximo max_concurrent rodando ao mesmo tempo, os demais
+    esperam em ordem de prioridade (maior primeiro) e de chegada.
+    """
+
+    def __init__(self, max_concurrent, history):
+        self.max_concurrent = max_concurrent
+        self.history = history
+        self.jobs = OrderedDict()
+        self._queue = []
+        self._seq = itertools.count()
+        self._running = 0
+
+    def submit(self, kind, fn, kwargs, priority=0, pool="render"):
+        job = Job(kind, fn, kwargs, priority, pool)
+        self.jobs[job.id] = job
+        heapq.heappush(self._queue, (-priority, next(self._seq), job))
+        self._dispatch()
+        return job
+
+    def track(self, kind, pool="ffmpeg"):
+        """
+        Registra um trabalho que roda fora da fila (ex.: /ffmpeg) para que
+        apareça em /jobs com progresso. Termine com complete().
+        """
+        job = Job(kind, None, {}, 0, pool)
+        job.status = "running"
+        job.started_at = time.time()
+        self.jobs[job.id] = job
+        return job
+
+    def complete(self, job, result=None, error=None):
+        job.result = result
+        job.error = error
+        job.status = "error" if error else "done"
+        job.finished_at = time.time()
+        progress_store().pop(job.id, None)
+        job.done.set()
+        self._prune()
+
+    def cancel(self, job):
+        if job.status != "queued":
+            return False
+        self._queue = [item for item in self._queue if item[2] is not job]
+        heapq.heapify(self._queue)
+        job.status = "cancelled"
+        job.finished_at = time.time()
+        job.done.set()
+        return True
+
+    def queue_position(self, job):
+        if job.status != "queued":
+            return None
+        return sorted(self._queue).index(next(item for item in self._queue if item[2] is job))
+
+    def _dispatch(self):
+        while self._running < self.max_concurrent and self._queue:
+            _, _, job = heapq.heappop(self._queue)
+            self._running += 1
+            asyncio.get_running_loop().create_task(self._run(job))
+
+    async def _run(self, job):
+        job.status = "running"
+        job.started_at = time.time()
+        try:
+            reporter = ProgressReporter(progress_store(), job.id)
+            job.result = await run_in_pool(job.pool, job.fn, progress=reporter, **job.kwargs)
+            job.status = "done"
+        except Exception as e:
+            job.error = str(e)
+            job.status = "error"
+        finally:
+            job.finished_at = time.time()
+            self._running -= 1
+            progress_store().pop(job.id, None)
+            job.done.set()
+            self._prune()
+            self._dispatch()
+
+    def _prune(self):
+        finished = [j for j in self.jobs.values() if j.done.is_set()]
+        for job in finished[:max(len(finished) - self.history, 0)]:
+            del self.jobs[job.id]
+
+
+render_scheduler = RenderScheduler(MAX_CONCURRENT_RENDERS, JOB_HISTORY)
+
+
+async def run_render_job(kind, fn, kwargs, priority, async_job, message, pool="render"):
+    """
+    Envia o render para a fila. Em modo assíncrono responde 202 com o id do job;
+    senão espera o fim e responde como antes.
+    """
+    job = render_scheduler.submit(kind, fn, kwargs, priority, pool)
+    if async_job:
+        return JSONResponse({
+            "job_id": job.id,
+            "status": job.status,
+            "status_url": f"/jobs/{job.id}",
+            "progress_url": f"/jobs/{job.id}/progress",
+            "result_url": f"/jobs/{job.id}/result"
+        }, status_code=202)
+
+    await job.done.wait()
+    if job.status != "done":
+        return JSONResponse({"error": job.error or job.status}, status_code=500)
+    return JSONResponse({"message": message, **job.result})
+
+
+# ========================
+# 📥 UPLOADS EM STREAMING (blocos + hash)
+# ========================
+class UploadTooLarge(Exception):
+    pass
+
+
+class UploadSizeLimit:
+    """
+    Middleware ASGI que limita o corpo das requisições. Content-Length acima do
+    limite é rejeitado antes de ler o corpo; sem Content-Length (chunked), os
+    bytes são contados em receive() e a leitura é cortada ao passar do limite,
+    antes de o FastAPI terminar de gravar o multipart no disco.
+    """
+
+    def __init__(self, app, max_bytes):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    def _too_large(self):
+        return JSONResponse({"error": f"Arquivo excede o limite de {MAX_UPLOAD_MB} MB"}, status_code=413)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST":
+            return await self.app(scope, receive, send)
+
+        length = dict(scope["headers"]).get(b"content-length", b"")
+        if length.isdigit() and int(length) > self.max_bytes:
+            return await self._too_large()(scope, receive, send)
+
+        received = 0
+        exceeded = response_started = False
+
+        async def limited_receive():
+            nonlocal received, exceeded
+            if exceeded:
+                return {"type": "http.disconnect"}
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    # Para de ler: para o app, o cliente desconectou
+                    exceeded = True
+                    return {"type": "http.disconnect"}
+            return message
+
+        async def guarded_send(message):
+            nonlocal response_started
+            if exceeded:
+                # Troca a resposta do app (erro de parse, 400...) pelo 413
+                if not response_started:
+                    response_started = True
+                    await self._too_large()(scope, receive, send)
+                return
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except Exception:
+            if not exceeded:
+                raise
+        if exceeded and not response_started:
+            await self._too_large()(scope, receive, send)
+
+
+# Folga de 1 MB para os demais campos do formulário multipart
+app.add_middleware(UploadSizeLimit, max_bytes=MAX_UPLOAD_BYTES + 2**20)
+
+
+def _write_chunk(f, digest, chunk):
+    digest.update(chunk)
+    f.write(chunk)
+
+
+async def save_upload(file: UploadFile, dest_path, max_bytes=MAX_UPLOAD_BYTES):
+    """
+    Grava o upload em disco em blocos de UPLOAD_CHUNK_BYTES (memória constante),
+    calculando o sha256 durante a escrita. Retorna (tamanho, sha256).
+    """
+    if file.size is not None and file.size > max_bytes:
+        raise UploadTooLarge(f"Arquivo excede o limite de {max_bytes // 2**20} MB")
+
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with open(dest_path, "wb") as f:
+            while True:
+                chunk = await file.read(UPLOAD_CHUNK_BYTES)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLarge(f"Arquivo excede o limite de {max_bytes // 2**20} MB")
+                await run_in_threadpool(_write_chunk, f, digest, chunk)
+    except BaseException:
+        # Não deixa arquivo parcial para trás
+        if os.path.exists(dest_path):
+            os.remove(dest_path)
+        raise
+
+    return size, digest.hexdigest()
+
+
+# ========================
+# 🗄 STORE ENDEREÇADO POR CONTEÚDO (uploads deduplicados)
+# ========================
+class ContentStore:
+    """
+    Guarda cada conteúdo uma única vez em UPLOAD_DIR/store/objects, pelo sha256.
+    Um índice JSON mantém a contagem de referências e os nomes (aliases) já
+    usados para cada arquivo; reenviar um conteúdo conhecido só mexe no índice.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.objects_dir = os.path.join(root, "objects")
+        self.tmp_dir = os.path.join(root, "tmp")
+        self.index_path = os.path.join(root, "index.json")
+        os.makedirs(self.objects_dir, exist_ok=True)
+        os.makedirs(self.tmp_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._index = self._load()
+
+    def _load(self):
+        if os.path.exists(self.index_path):
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        return {"objects": {}, "aliases": {}}
+
+    def _save(self):
+        # Escrita atômica: o índice nunca fica pela metade
+        tmp_path = f"{self.index_path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._index, f)
+        os.replace(tmp_path, self.index_path)
+
+    def new_temp_path(self):
+        return os.path.join(self.tmp_dir, uuid.uuid4().hex)
+
+    def _object_path(self, sha256, ext):
+        # Mantém a extensão do primeiro upload (alguns leitores escolhem o decoder por ela)
+        return os.path.join(self.objects_dir, sha256[:2], f"{sha256}{ext}")
+
+    def _describe(self, sha256):
+        entry = self._index["objects"][sha256]
+        return {"sha256": sha256, **entry}
+
+    def _add_alias(self, sha256, filename):
+        if not filename:
+            return
+        entry = self._index["objects"][sha256]
+        if filename not in entry["aliases"]:
+            entry["aliases"].append(filename)
+        self._index["aliases"][filename] = sha256
+
+    def add_file(self, temp_path, sha256, size, filename):
+        """
+        Move um upload já gravado (e com hash calculado) para o store.
+        Se o conteúdo já existe, descarta a cópia nova. Retorna (metadados, deduplicado).
+        """
+        with self._lock:
+            entry = self._index["objects"].get(sha256)
+            deduplicated = entry is not None and os.path.exists(entry["path"])
+            if deduplicated:
+                os.remove(temp_path)
+            else:
+                ext = os.path.splitext(filename or "")[1].lower()
+                path = self._object_path(sha256, ext)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(temp_path, path)
+                entry = {"path": path, "size": size, "refcount": 0, "aliases": [], "created": time.time()}
+                self._index["objects"][sha256] = entry
+
+            entry["refcount"] += 1
+            self._add_alias(sha256, filename)
+            self._save()
+            return self._describe(sha256), deduplicated
+
+    def add_ref(self, ref, filename=None):
+        """
+        Nova referência para um conteúdo já armazenado (sem enviar bytes).
+        """
+        with self._lock:
+            sha256 = self._lookup(ref)
+            if sha256 is None:
+                raise KeyError(ref)
+            self._index["objects"][sha256]["refcount"] += 1
+            self._add_alias(sha256, filename)
+            self._save()
+            return self._describe(sha256)
+
+    def release(self, ref):
+        """
+        Remove uma referência; o arquivo é apagado quando a contagem chega a zero.
+        """
+        with self._lock:
+            sha256 = self._lookup(ref)
+            if sha256 is None:
+                raise KeyError(ref)
+            entry = self._index["objects"][sha256]
+            entry["refcount"] -= 1
+            if entry["refcount"] <= 0:
+                del self._index["objects"][sha256]
+                for alias in entry["aliases"]:
+                    if self._index["aliases"].get(alias) == sha256:
+                        del self._index["aliases"][alias]
+                if os.path.exists(entry["path"]):
+                    os.remove(entry["path"])
+            self._save()
+            return {"sha256": sha256, **entry}
+
+    def _lookup(self, ref):
+        # Aceita "sha256:<hex>", o hex puro ou um nome de arquivo já enviado
+        if ref.startswith("sha256:"):
+            ref = ref[len("sha256:"):]
+        if ref in self._index["objects"]:
+            return ref
+        return self._index["aliases"].get(ref)
+
+    def info(self, ref):
+        with self._lock:
+            sha256 = self._lookup(ref)
+            return self._describe(sha256) if sha256 else None
+
+    def resolve(self, ref):
+        """
+        Caminho do arquivo para uma referência (hash ou alias), ou None.
+        """
+        with self._lock:
+            sha256 = self._lookup(ref)
+            if sha256 is None:
+                return None
+            path = self._index["objects"][sha256]["path"]
+            return path if os.path.exists(path) else None
+
+
+upload_store = ContentStore(os.path.join(UPLOAD_DIR, "store"))
+
+
+def resolve_upload(ref):
+    """
+    Resolve um arquivo enviado: primeiro no store (hash ou alias), depois
+    como caminho relativo a UPLOAD_DIR (uploads antigos).
+    """
+    return upload_store.resolve(ref) or os.path.join(UPLOAD_DIR, ref)
+
+
+def resolve_upload_confined(ref):
+    """
+    Como resolve_upload, mas None para caminhos fora de UPLOAD_DIR (absolutos,
+    "..", links simbólicos): referências vindas do cliente não leem arquivos do host.
+    """
+    path = upload_store.resolve(ref)
+    if path:
+        return path
+    root = os.path.realpath(UPLOAD_DIR)
+    path = os.path.realpath(os.path.join(root, ref))
+    return path if path.startswith(root + os.sep) else None
+
+
+def resolve_images(image_pattern, image_hashes):
+    """
+    Lista de imagens para os endpoints Ken Burns: por padrão glob em
+    UPLOAD_DIR/imagens ou, com image_hashes, referências do store na ordem dada.
+    Retorna (imagens, referências não encontradas).
+    """
+    if image_hashes:
+        refs = [ref for ref in re.split(r"[,\s]+", image_hashes) if ref]
+        imagens = [upload_store.resolve(ref) for ref in refs]
+        missing = [ref for ref, path in zip(refs, imagens) if path is None]
+        return [path for path in imagens if path], missing
+    imagens_glob = os.path.join(UPLOAD_DIR, "imagens", image_pattern)
+    return sorted(glob.glob(imagens_glob)), []
+
+
+@functools.lru_cache(maxsize=4096)
+def _file_sha256(path, size, mtime_ns):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(UPLOAD_CHUNK_BYTES), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def file_sha256(path):
+    """
+    sha256 do conteúdo de um arquivo. Objetos do store já trazem o hash no nome;
+    os demais são lidos uma vez e memorizados por (caminho, tamanho, mtime).
+    """
+    if os.path.dirname(os.path.dirname(path)) == upload_store.objects_dir:
+        name = os.path.basename(path).split(".")[0]
+        if re.fullmatch(r"[0-9a-f]{64}", name):
+            return name
+    st = os.stat(path)
+    return _file_sha256(path, st.st_size, st.st_mtime_ns)
+
+
+def evict_lru(root, quota_bytes, suffix="", keep=None):
+    """
+    Despejo LRU de um cache em disco: apaga os arquivos (terminados em suffix)
+    usados há mais tempo, pela mtime que cada acerto atualiza, até o total caber
+    na cota. keep nunca é apagado.
+    """
+    entries, total = [], 0
+    for dirpath, _, filenames in os.walk(root):
+        for name in filenames:
+            if not name.endswith(suffix):
+                continue
+            path = os.path.join(dirpath, name)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            total += st.st_size
+            if path != keep:
+                entries.append((st.st_mtime, st.st_size, path))
+    for _, size, path in sorted(entries):
+        if total <= quota_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+
+
+# ========================
+# 🧠 REGISTRO DE MODELOS WHISPER (cache LRU)
+# ========================
+class WhisperModelRegistry:
+    """
+    Mantém cada modelo Whisper carregado uma única vez por (model_name, device).
+    Os modelos ficam em memória até estourar o orçamento em bytes; aí o menos
+    usado recentemente é descartado.
+    """
+
+    def __init__(self, budget_bytes):
+        self.budget_bytes = budget_bytes
+        self._models = OrderedDict()  # (model_name, device) -> (modelo, bytes)
+        self._lock = threading.Lock()
+        self._load_locks = {}
+        self._inference_locks = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.load_seconds = 0.0
+
+    @staticmethod
+    def default_device():
+        return "cuda" if torch.cuda.is_available() else "cpu"
+
+    @staticmethod
+    def _model_bytes(model):
+        tensors = list(model.parameters()) + list(model.buffers())
+        return sum(t.numel() * t.element_size() for t in tensors)
+
+    def _lookup(self, key):
+        entry = self._models.get(key)
+        if entry is None:
+            return None
+        self._models.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def get(self, model_name, device=None):
+        """
+        Retorna o modelo já carregado ou carrega (uma vez só, mesmo com
+        requisições concorrentes pedindo o mesmo modelo).
+        """
+        key = (model_name, device or self.default_device())
+
+        with self._lock:
+            model = self._lookup(key)
+            if model is not None:
+                return model
+            load_lock = self._load_locks.setdefault(key, threading.Lock())
+
+        with load_lock:
+            # Outra requisição pode ter carregado enquanto esperávamos
+            with self._lock:
+                model = self._lookup(key)
+                if model is not None:
+                    return model
+
+            inicio = time.perf_counter()
+            model = whisper.load_model(key[0], device=key[1])
+            elapsed = time.perf_counter() - inicio
+            size = self._model_bytes(model)
+
+            with self._lock:
+                self.misses += 1
+                self.load_seconds += elapsed
+                self._models[key] = (model, size)
+                self._evict(keep=key)
+
+            print(f"Modelo Whisper {key[0]} ({key[1]}) carregado em {elapsed:.1f}s ({size / 2**20:.0f} MB)")
+            return model
+
+    def inference_lock(self, model_name, device=None):
+        """
+        Lock por modelo: o Whisper instala hooks de kv-cache no próprio modelo
+        durante o decode, então a mesma instância não pode transcrever em paralelo.
+        """
+        key = (model_name, device or self.default_device())
+        with self._lock:
+            return self._inference_locks.setdefault(key, threading.Lock())
+
+    def _used_bytes(self):
+        return sum(size for _, size in self._models.values())
+
+    def _evict(self, keep):
+        # Remove LRU até caber no orçamento (o modelo recém-carregado sempre fica)
+        evicted = False
+        while self._used_bytes() > self.budget_bytes and len(self._models) > 1:
+            key = next(k for k in self._models if k != keep)
+            del self._models[key]
+            self.evictions += 1
+            evicted = True
+            print(f"Modelo Whisper {key[0]} ({key[1]}) removido do cache")
+        if evicted and torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 3) if total else 0.0,
+                "evictions": self.evictions,
+                "load_seconds_total": round(self.load_seconds, 2),
+                "load_seconds_avg": round(self.load_seconds / self.misses, 2) if self.misses else 0.0,
+                "budget_bytes": self.budget_bytes,
+                "used_bytes": self._used_bytes(),
+                "models": [
+                    {"model_name": name, "device": device, "bytes": size}
+                    for (name, device), (_, size) in self._models.items()
+                ],
+            }
+
+
+whisper_models = WhisperModelRegistry(WHISPER_CACHE_MB * 2**20)
+
+
+# ========================
+# 🔊 ÁUDIO PCM (decodificado uma vez por conteúdo)
+# ========================
+class PcmCache:
+    """
+    Áudio já no formato de entrada do Whisper (16 kHz, mono, float32), em
+    arquivos .f32 endereçados pelo sha256 do arquivo original e lidos via
+    memmap. Retranscrever com outro modelo ou idioma não decodifica de novo.
+    Despejo LRU (pela data de acesso) quando passa da cota.
+    """
+
+    SAMPLE_RATE = 16000
+
+    def __init__(self, root, quota_bytes):
+        self.root = root
+        self.quota_bytes = quota_bytes
+        os.makedirs(root, exist_ok=True)
+        self._lock = threading.Lock()
+        self._decode_locks = {}
+        self.hits = 0
+        self.misses = 0
+        self.decode_seconds = 0.0
+
+    def _path(self, digest):
+        return os.path.join(self.root, digest[:2], f"{digest}.f32")
+
+    def _decode(self, src_path, dest_path):
+        os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+        tmp_path = f"{dest_path}.{uuid.uuid4().hex}.tmp"
+        cmd = [
+            "ffmpeg", "-nostdin", "-hide_banner", "-loglevel", "error", "-threads", "0",
+            "-i", src_path, "-vn", "-map", "0:a:0",
+            "-ac", "1", "-ar", str(self.SAMPLE_RATE), "-f", "f32le", "-y", tmp_path
+        ]
+        inicio = time.perf_counter()
+        result = subprocess.run(cmd, capture_output=True, text=True)
+        if result.returncode != 0:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise RuntimeError(f"Erro ao decodificar áudio: {result.stderr.strip()}")
+        os.replace(tmp_path, dest_path)
+        elapsed = time.perf_counter() - inicio
+        with self._lock:
+            self.misses += 1
+            self.decode_seconds += elapsed
+        print(f"Áudio {os.path.basename(src_path)} decodificado em {elapsed:.1f}s")
+
+    def load(self, path, digest=None):
+        """
+        Retorna o áudio como array float32 mapeado do disco (copy-on-write: o
+        Whisper pode usá-lo direto). digest evita reler o arquivo para o hash.
+        """
+        digest = (digest or file_sha256(path)).removeprefix("sha256:")
+        cached = self._path(digest)
+        with self._lock:
+            decode_lock = self._decode_locks.setdefault(digest, threading.Lock())
+
+        # O mesmo conteúdo pedido em paralelo é decodificado uma vez só
+        with decode_lock:
+            if os.path.exists(cached):
+                os.utime(cached)  # marca uso recente (LRU)
+                with self._lock:
+                    self.hits += 1
+            else:
+                self._decode(path, cached)
+                with self._lock:
+                    # Quem já mapeou um arquivo despejado continua lendo (o inode só some no fim)
+                    evict_lru(self.root, self.quota_bytes, suffix=".f32", keep=cached)
+
+        if os.path.getsize(cached) == 0:
+            return np.zeros(0, dtype=np.float32)
+        return np.memmap(cached, dtype=np.float32, mode="c")
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "decode_seconds_total": round(self.decode_seconds, 2),
+                "quota_bytes": self.quota_bytes,
+            }
+
+
+pcm_cache = PcmCache(os.path.join(CACHE_DIR, "pcm"), PCM_CACHE_MB * 2**20)
+
+
+# ========================
+# 📝 CACHE DE TRANSCRIÇÕES
+# ========================
+class TranscriptCache:
+    """
+    Resultados do model.transcribe em JSON, por (sha256 do áudio, modelo,
+    idioma e demais opções). Qualquer formato de saída é gerado a partir do
+    resultado guardado, sem rodar o modelo de novo.
+    """
+
+    VERSION = 1
+
+    def __init__(self, root, quota_bytes):
+        self.root = root
+        self.quota_bytes = quota_bytes
+        os.makedirs(root, exist_ok=True)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, audio_sha256, model_name, language=None, **options):
+        payload = json.dumps({
+            "version": self.VERSION,
+            "audio": audio_sha256.removeprefix("sha256:"),
+            "model": model_name,
+            "language": language or "auto",
+            **options
+        }, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.root, key[:2], f"{key}.json")
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                result = json.load(f)
+        except (FileNotFoundError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+        os.utime(path)  # marca uso recente (LRU)
+        with self._lock:
+            self.hits += 1
+        return result
+
+    def put(self, key, result):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            # numpy/torch podem aparecer nos segmentos: default=float converte escalares
+            json.dump(result, f, ensure_ascii=False, default=float)
+        os.replace(tmp_path, path)
+        with self._lock:
+            evict_lru(self.root, self.quota_bytes, suffix=".json", keep=path)
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "quota_bytes": self.quota_bytes}
+
+
+transcript_cache = TranscriptCache(os.path.join(CACHE_DIR, "transcripts"), TRANSCRIPT_CACHE_MB * 2**20)
+
+
+def transcribe_file(input_path, model_name, audio_sha256=None, use_cache=True, **kwargs):
+    """
+    Transcrição bloqueante. Roda no pool "whisper". Retorna (resultado, cached).
+    O resultado vem do transcript_cache quando possível; senão o áudio vem do
+    pcm_cache (decodificado fora do lock de inferência).
+    """
+    audio_sha256 = audio_sha256 or file_sha256(input_path)
+    key = transcript_cache.key(audio_sha256, model_name, **kwargs)
+    if use_cache:
+        result = transcript_cache.get(key)
+        if result is not None:
+            return result, True
+
+    model = whisper_models.get(model_name)
+    audio = pcm_cache.load(input_path, audio_sha256)
+    with whisper_models.inference_lock(model_name):
+        result = model.transcribe(audio, **kwargs)
+    transcript_cache.put(key, result)
+    return result, False
+
+
+# Formatos dos writers do Whisper ("text" é aceito como sinônimo de "txt")
+WHISPER_FORMATS = ("txt", "vtt", "srt", "tsv", "json")
+WHISPER_FORMAT_ALIASES = {"text": "txt"}
+WHISPER_MEDIA_TYPES = {
+    "txt": "text/plain",
+    "vtt": "text/vtt",
+    "srt": "application/x-subrip",
+    "tsv": "text/tab-separated-values",
+    "json": "application/json",
+}
+
+
+def parse_formats(output_format):
+    """
+    "all", um formato ou vários separados por vírgula -> lista de formatos dos
+    writers. Levanta ValueError com formato desconhecido.
+    """
+    if not output_format or output_format == "all":
+        return list(WHISPER_FORMATS)
+    formats = []
+    for fmt in re.split(r"[,\s]+", output_format.lower()):
+        if not fmt:
+            continue
+        fmt = WHISPER_FORMAT_ALIASES.get(fmt, fmt)
+        if fmt not in WHISPER_FORMATS:
+            raise ValueError(f"Formato inválido: {fmt} (use {', '.join(WHISPER_FORMATS)} ou all)")
+        if fmt not in formats:
+            formats.append(fmt)
+    return formats
+
+
+@functools.lru_cache(maxsize=None)
+def _transcript_writer(fmt):
+    # Writers não guardam estado: uma instância por formato basta.
+    # O diretório de saída nunca é usado (só write_result, sem arquivo).
+    return get_writer(fmt, UPLOAD_DIR)
+
+
+def render_transcript(result, formats):
+    """
+    Gera o conteúdo de cada formato com os writers oficiais, direto em memória
+    (write_result num StringIO): nenhum arquivo é criado.
+    """
+    contents = {}
+    for fmt in formats:
+        buffer = io.StringIO()
+        _transcript_writer(fmt).write_result(result, buffer)
+        contents[fmt] = buffer.getvalue()
+    return contents
+
+
+def transcribe_batch(paths, names, model_name, formats, workers=WHISPER_BATCH_WORKERS, digests=None,
+                     use_cache=True, **kwargs):
+    """
+    Transcreve vários arquivos com um único modelo carregado. Roda no pool
+    "whisper": a decodificação do áudio (subprocesso do ffmpeg) roda em até
+    `workers` threads enquanto o modelo transcreve um arquivo por vez.
+    Arquivos já transcritos com o mesmo modelo/idioma saem do transcript_cache,
+    e o modelo só é carregado no primeiro arquivo que não está no cache.
+    """
+    lock = whisper_models.inference_lock(model_name)
+
+    def transcribe_one(path, name, digest):
+        inicio = time.perf_counter()
+        try:
+            digest = digest or file_sha256(path)
+            key = transcript_cache.key(digest, model_name, **kwargs)
+            result = transcript_cache.get(key) if use_cache else None
+            cached = result is not None
+            if not cached:
+                # O registro carrega uma vez só, mesmo com várias threads pedindo juntas
+                model = whisper_models.get(model_name)
+                audio = pcm_cache.load(path, digest)
+                with lock:
+                    result = model.transcribe(audio, **kwargs)
+                transcript_cache.put(key, result)
+            return {
+                "file": name,
+                "language": result.get("language", kwargs.get("language") or "auto"),
+                "cached": cached,
+                "seconds": round(time.perf_counter() - inicio, 2),
+                "content": render_transcript(result, formats)
+            }
+        except Exception as e:
+            return {"file": name, "error": str(e)}
+
+    with ThreadPoolExecutor(max(workers, 1), thread_name_prefix="whisper-batch") as pool:
+        return list(pool.map(transcribe_one, paths, names, digests or [None] * len(paths)))
+
+
+def transcribe_stream(input_path, model_name, audio_sha256=None, cancelled=None, language=None):
+    """
+    Gerador de eventos da transcrição (bloqueante; roda no pool "whisper").
+    O áudio é transcrito em janelas de STREAM_WINDOW_SECONDS: cada janela vira
+    segmentos assim que termina. O último segmento de uma janela pode ter sido
+    cortado no meio, então a próxima janela recomeça no fim do penúltimo.
+    Eventos: language, segment (com progress) e done. Áudio já transcrito com
+    o mesmo modelo/idioma sai inteiro do transcript_cache.
+    """
+    inicio = time.perf_counter()
+    audio_sha256 = audio_sha256 or file_sha256(input_path)
+    cached = transcript_cache.get(transcript_cache.key(audio_sha256, model_name, language=language))
+    if cached is not None:
+        yield {"event": "language", "language": cached.get("language")}
+        segments = cached.get("segments", [])
+        for seg in segments:
+            segment = {"id": seg["id"], "start": round(seg["start"], 3), "end": round(seg["end"], 3), "text": seg["text"]}
+            yield {"event": "segment", "segment": segment, "progress": 1.0}
+        yield {
+            "event": "done",
+            "language": cached.get("language"),
+            "segments": len(segments),
+            "text": cached.get("text", ""),
+            "duration": round(segments[-1]["end"], 2) if segments else 0.0,
+            "seconds": round(time.perf_counter() - inicio, 2),
+            "cached": True,
+        }
+        return
+
+    model = whisper_models.get(model_name)
+    lock = whisper_models.inference_lock(model_name)
+    audio = pcm_cache.load(input_path, audio_sha256)
+    total = len(audio)
+    window = STREAM_WINDOW_SECONDS * PcmCache.SAMPLE_RATE
+
+    options = {"language": language} if language else {}
+    if language:
+        yield {"event": "language", "language": language}
+
+    segments, offset = [], 0
+    while offset < total:
+        if cancelled is not None and cancelled.is_set():
+            return
+        chunk = audio[offset:offset + window]
+        last_window = offset + window >= total
+        with lock:
+            result = model.transcribe(chunk, **options)
+
+        if "language" not in options:
+            options["language"] = result.get("language")
+            yield {"event": "language", "language": options["language"]}
+
+        window_segments = result["segments"]
+        advance = len(chunk)
+        if not last_window and len(window_segments) > 1:
+            window_segments = window_segments[:-1]
+            advance = int(window_segments[-1]["end"] * PcmCache.SAMPLE_RATE) or len(chunk)
+
+        start_seconds = offset / PcmCache.SAMPLE_RATE
+        for seg in window_segments:
+            segment = {
+                "id": len(segments),
+                "start": round(start_seconds + seg["start"], 3),
+                "end": round(start_seconds + seg["end"], 3),
+                "text": seg["text"],
+            }
+            segments.append(segment)
+            yield {
+                "event": "segment",
+                "segment": segment,
+                "progress": round(min(segment["end"] * PcmCache.SAMPLE_RATE / total, 1.0), 4) if total else 1.0,
+            }
+
+        # Contexto para a próxima janela (o Whisper corta o prompt no limite de tokens)
+        if window_segments:
+            options["initial_prompt"] = "".join(seg["text"] for seg in window_segments[-4:])
+        offset += advance
+
+    yield {
+        "event": "done",
+        "language": options.get("language"),
+        "segments": len(segments),
+        "text": "".join(seg["text"] for seg in segments),
+        "duration": round(total / PcmCache.SAMPLE_RATE, 2),
+        "seconds": round(time.perf_counter() - inicio, 2),
+        "cached": False,
+    }
+
+
+async def iter_in_pool(kind, gen_fn, *args, **kwargs):
+    """
+    Consome um gerador bloqueante num pool e repassa os itens ao event loop
+    assim que são produzidos. Se o cliente desistir, o gerador recebe
+    cancelled (threading.Event) e para na próxima checagem.
+    """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    cancelled = threading.Event()
+    done = object()
+
+    def produce():
+        try:
+            for item in gen_fn(*args, cancelled=cancelled, **kwargs):
+                loop.call_soon_threadsafe(queue.put_nowait, item)
+                if cancelled.is_set():
+                    break
+        except Exception as e:
+            loop.call_soon_threadsafe(queue.put_nowait, {"event": "error", "error": str(e)})
+        finally:
+            loop.call_soon_threadsafe(queue.put_nowait, done)
+
+    loop.run_in_executor(get_pool(kind), produce)
+    try:
+        while True:
+            item = await queue.get()
+            if item is done:
+                break
+            yield item
+    finally:
+        cancelled.set()
+
+
+# ========================
+# 🧠 ENDPOINT: /whisper
+# ========================
+@app.post("/whisper")
+async def transcribe_audio(
+    file: UploadFile = File(None),
+    sha256: str = Form(None),  # sem file: áudio já transcrito (cache) ou já no store
+    language: str = Form(None),
+    model_name: str = Form("small"),
+    output_format: str = Form("text"),  # um formato ou vários: "srt,vtt" (ou "all")
+    use_cache: bool = Form(True),  # False: transcreve de novo mesmo com resultado em cache
+    raw: bool = Form(False)  # True: responde o próprio arquivo (um formato), sem JSON
+):
+    """
+    Transcreve áudio com o modelo Whisper. Suporta formatos: text/txt, srt, vtt, tsv, json.
+    O resultado fica em cache por (áudio, modelo, idioma): pedir outro formato
+    do mesmo áudio não roda o modelo de novo.
+    """
+    input_path = None
+    try:
+        try:
+            formats = parse_formats(output_format)
+        except ValueError as e:
+            return JSONResponse({"error": str(e)}, status_code=400)
+        if not formats:
+            return JSONResponse({"error": "Informe output_format"}, status_code=400)
+
+        kwargs = {}
+        if language:
+            kwargs["language"] = language
+
+        result = None
+        if file is not None:
+            input_path = os.path.join(UPLOAD_DIR, f"{uuid.uuid4()}_{file.filename}")
+            _, digest = await save_upload(file, input_path)
+            source_path, name = input_path, file.filename
+        elif sha256:
+            digest = sha256.removeprefix("sha256:")
+            # Só formato novo de um áudio já transcrito: nem precisa do arquivo
+            result = transcript_cache.get(transcript_cache.key(digest, model_name, **kwargs)) if use_cache else None
+            source_path, name = upload_store.resolve(digest), digest
+            if result is None and source_path is None:
+                return JSONResponse({"error": f"Áudio desconhecido: {sha256} (envie 'file')"}, status_code=404)
+        else:
+            return JSONResponse({"error": "Envie 'file' ou 'sha256'"}, status_code=400)
+
+        if file is not None or result is None:
+            # Modelo compartilhado (carregado uma vez por processo), fora do event loop
+            result, cached = await run_in_pool(
+                "whisper", transcribe_file, source_path, model_name,
+                audio_sha256=digest, use_cache=use_cache, **kwargs
+            )
+        else:
+            cached = True
+
+        contents = await run_in_threadpool(render_transcript, result, formats)
+        single = len(formats) == 1
+
+        if raw:
+            if not single:
+                return JSONResponse({"error": "raw=true aceita um único output_format"}, status_code=400)
+            fmt = formats[0]
+            base = re.sub(r"[^A-Za-z0-9._-]+", "_", os.path.splitext(os.path.basename(name))[0]) or "transcript"
+            return Response(
+                contents[fmt],
+                media_type=f"{WHISPER_MEDIA_TYPES[fmt]}; charset=utf-8",
+                headers={
+                    "Content-Disposition": f'inline; filename="{base}.{fmt}"',
+                    "X-Transcript-Language": str(result.get("language", language or "auto")),
+                    "X-Transcript-Cached": str(cached).lower(),
+                }
+            )
+
+        return JSONResponse({
+            "format": formats[0] if single else formats,
+            "language": result.get("language", language or "auto"),
+            "sha256": digest,
+            "cached": cached,
+            "content": contents[formats[0]] if single else contents
+        })
+
+    except UploadTooLarge as e:
+        return JSONResponse({"error": str(e)}, status_code=413)
+    except Exception as e:
+        return JSONResponse({"error": str(e)}, status_code=500)
+    finally:
+        # Limpeza
+        if input_path and os.path.exists(input_path):
+            os.remove(input_path)
+
+
+@app.post("/whisper/batch")
+async def transcribe_audio_batch(
+    files: List[UploadFile] = File(None),
+    names: str = Form(None),  # arquivos já enviados (nome em uploads/ ou hash do store), separados por vírgula
+    language: str = Form(None),
+    model_name: str = Form("small"),
+    output_format: str = Form("all"),  # "all" ou lista: txt,vtt,srt,tsv,json
+    workers: int = Form(WHISPER_BATCH_WORKERS),
+    use_cache: bool = Form(True)  # False: transcreve de novo mesmo com resultado em cache
+):
+    """
+    Transcreve vários arquivos numa requisição, com o mesmo modelo carregado.
+    Retorna, por arquivo, o conteúdo em cada formato pedido.
+    """
+    saved = []
+    try:
+        try:
+            formats = parse_formats(output_format)
+        except ValueError as e:
+            return JSONResponse({"error": str(e)}, status_code=400)
+
+        paths, labels, digests = [], [], []
+        for ref in re.split(r"[,\s]+", names or ""):
+            if not ref:
+                continue
+            path = resolve_upload_confined(ref)
+            if path is None:
+                return JSONResponse({"error": f"Caminho fora de {UPLOAD_DIR}: {ref}"}, status_code=400)
+            if not os.path.isfile(path):
+                return JSONResponse({"error": f"Arquivo não encontrado: {ref}"}, status_code=400)
+            paths.append(path)
+            labels.append(ref)
+            digests.append(None)
+
+        for file in files or []:
+            input_path = os.path.join(UPLOAD_DIR, f"{uuid.uuid4()}_{file.filename}")
+            saved.append(input_path)
+            _, digest = await save_upload(file, input_path)
+            paths.append(input_path)
+            labels.append(file.filename)
+            digests.append(digest)
+
+        if not paths:
+            return JSONResponse({"error": "Envie 'files' ou 'names'"}, status_code=400)
+
+        kwargs = {}
+        if language:
+            kwargs["language"] = language
+
+        inicio = time.perf_counter()
+        results = await run_in_pool(
+            "whisper", transcribe_batch, paths, labels, model_name, formats,
+            workers=min(max(workers, 1), len(paths)), digests=digests, use_cache=use_cache, **kwargs
+        )
+
+        return JSONResponse({
+            "model_name": model_name,
+            "formats": formats,
+            "files": len(results),
+            "errors": sum(1 for r in results if "error" in r),
+            "cached": sum(1 for r in results if r.get("cached")),
+            "seconds": round(time.perf_counter() - inicio, 2),
+            "results": results
+        })
+
+    except UploadTooLarge as e:
+        return JSONResponse({"error": str(e)}, status_code=413)
+    except Exception as e:
+        return JSONResponse({"error": str(e)}, status_code=500)
+    finally:
+        # Limpeza (só dos arquivos enviados nesta requisição)
+        for path in saved:
+            if os.path.exists(path):
+                os.remove(path)
+
+
+@app.post("/whisper/stream")
+async def transcribe_audio_stream(
+    file: UploadFile = File(...),
+    language: str = Form(None),
+    model_name: str = Form("small"),
+    stream_format: str = Form("sse")  # "sse" (text/event-stream) ou "jsonl" (uma linha JSON por evento)
+):
+    """
+    Transcreve emitindo cada segmento assim que fica pronto: idioma detectado,
+    segmentos com a fração concluída e um resumo final.
+    """
+    if stream_format not in ("sse", "jsonl"):
+        return JSONResponse({"error": f"stream_format inválido: {stream_format}"}, status_code=400)
+
+    input_path = os.path.join(UPLOAD_DIR, f"{uuid.uuid4()}_{file.filename}")
+    try:
+        _, digest = await save_upload(file, input_path)
+    except UploadTooLarge as e:
+        return JSONResponse({"error": str(e)}, status_code=413)
+    except Exception as e:
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+    async def events():
+        try:
+            async for event in iter_in_pool(
+                "whisper", transcribe_stream, input_path, model_name,
+                audio_sha256=digest, language=language
+            ):
+                data = json.dumps(event, ensure_ascii=False)
+                if stream_format == "sse":
+                    yield f"event: {event['event']}\ndata: {data}\n\n"
+                else:
+                    yield data + "\n"
+        finally:
+            # Limpeza
+            if os.path.exists(input_path):
+                os.remove(input_path)
+
+    media_type = "text/event-stream" if stream_format == "sse" else "application/x-ndjson"
+    return StreamingResponse(
+        events(), media_type=media_type,
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.get("/whisper/models")
+def whisper_models_stats():
+    """
+    Estatísticas do cache de modelos Whisper (hits, misses, tempo de carga, memória)
+    e dos caches de áudio decodificado e de transcrições.
+    """
+    return {**whisper_models.stats(), "pcm_cache": pcm_cache.stats(), "transcript_cache": transcript_cache.stats()}
+
+
+# ========================
+# 🎬 ENDPOINT: /ffmpeg (conversão simples)
+# ========================
+# Muxers que não precisam voltar no arquivo: a saída vai direto do stdout do
+# ffmpeg para a resposta. Formato -> (muxer, media type)
+PIPE_FORMATS = {
+    "mp3": ("mp3", "audio/mpeg"),
+    "wav": ("wav", "audio/wav"),
+    "ogg": ("ogg", "audio/ogg"),
+    "oga": ("ogg", "audio/ogg"),
+    "opus": ("opus", "audio/ogg"),
+    "flac": ("flac", "audio/flac"),
+    "aac": ("adts", "audio/aac"),
+    "mka": ("matroska", "audio/x-matroska"),
+    "mkv": ("matroska", "video/x-matroska"),
+    "webm": ("webm", "video/webm"),
+    "ts": ("mpegts", "video/mp2t"),
+}
+
+# Entradas cujo índice pode estar no fim do arquivo (moov do mp4/mov): o ffmpeg
+# precisa de seek, então vão para um arquivo temporário em vez do stdin
+SEEKABLE_INPUTS = {".mp4", ".m4a", ".m4v", ".mov", ".3gp", ".3g2", ".mj2"}
+
+PIPE_CHUNK_BYTES = 256 * 2**10
+
+# Planejador de remux: codecs que cada contêiner aceita por tipo de stream (copiados
+# sem reencode) e o encoder usado quando o codec não cabe. ANY_CODEC = aceita tudo.
+# mp3 e wav ficam de fora: copiar só valeria para entrada no mesmo formato, e o
+# planejamento exige a entrada em disco (sem streaming pelo stdin).
+ANY_CODEC = None
+CONTAINER_CODECS = {
+    "mp4": {
+        "video": ({"h264", "hevc", "av1", "vp9", "mpeg4"}, "libx264"),
+        "audio": ({"aac", "mp3", "alac", "ac3", "eac3", "opus", "flac"}, "aac"),
+        "subtitle": ({"mov_text"}, "mov_text"),
+    },
+    "m4v": {
+        "video": ({"h264", "hevc", "mpeg4"}, "libx264"),
+        "audio": ({"aac", "mp3", "ac3"}, "aac"),
+    },
+    "mov": {
+        "video": ({"h264", "hevc", "mpeg4", "prores", "mjpeg"}, "libx264"),
+        "audio": ({"aac", "mp3", "alac", "pcm_s16le", "pcm_s24le"}, "aac"),
+        "subtitle": ({"mov_text"}, "mov_text"),
+    },
+    "m4a": {"audio": ({"aac", "alac"}, "aac")},
+    "mkv": {
+        "video": (ANY_CODEC, "libx264"),
+        "audio": (ANY_CODEC, "aac"),
+        "subtitle": ({"subrip", "ass", "ssa", "webvtt", "hdmv_pgs_subtitle", "dvd_subtitle"}, "srt"),
+    },
+    "mka": {"audio": (ANY_CODEC, "aac")},
+    "webm": {
+        "video": ({"vp8", "vp9", "av1"}, "libvpx-vp9"),
+        "audio": ({"opus", "vorbis"}, "libopus"),
+        "subtitle": ({"webvtt"}, "webvtt"),
+    },
+    "ts": {
+        "video": ({"h264", "hevc", "mpeg2video"}, "libx264"),
+        "audio": ({"aac", "mp3", "mp2", "ac3", "eac3"}, "aac"),
+    },
+    "ogg": {"audio": ({"vorbis", "opus", "flac"}, "libvorbis")},
+    "oga": {"audio": ({"vorbis", "opus", "flac"}, "libvorbis")},
+    "opus": {"audio": ({"opus"}, "libopus")},
+    "flac": {"audio": ({"flac"}, "flac")},
+    "aac": {"audio": ({"aac"}, "aac")},
+}
+# Legendas em texto podem ser convertidas entre formatos; as de bitmap, não
+TEXT_SUBTITLES = {"subrip", "ass", "ssa", "webvtt", "mov_text", "text"}
+
+
+def ffprobe(path):
+    """
+    Streams e contêiner de um arquivo (ffprobe -show_streams -show_format). Bloqueante.
+    """
+    cmd = ["ffprobe", "-v", "error", "-show_streams", "-show_format", "-of", "json", path]
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"Erro FFprobe: {result.stderr.strip()}")
+    return json.loads(result.stdout)
+
+
+def _default_stream_score(st):
+    # Regra de seleção padrão do ffmpeg: maior resolução (vídeo) ou mais canais
+    # (áudio), com bônus para a disposição default; empate fica com o primeiro
+    bonus = 5000000 if st.get("disposition", {}).get("default") else 0
+    if st.get("codec_type") == "video":
+        return (st.get("width") or 0) * (st.get("height") or 0) + bonus
+    return (st.get("channels") or 0) + bonus
+
+
+def plan_conversion(probe, output_format):
+    """
+    Escolhe os streams da saída pela regra padrão do ffmpeg (vídeo de maior
+    resolução, áudio com mais canais, primeira legenda que o contêiner aceita)
+    e, para cada um, copia (-c copy) quando o codec cabe no contêiner ou
+    reencoda só esse stream. Retorna (argumentos do ffmpeg, plano por stream).
+    """
+    table = CONTAINER_CODECS[output_format]
+    args, plan = [], []
+    for kind in ("video", "audio", "subtitle"):
+        if kind not in table:
+            continue
+        allowed, encoder = table[kind]
+        candidates = [
+            st for st in probe.get("streams", [])
+            if st.get("codec_type") == kind and not st.get("disposition", {}).get("attached_pic")
+        ]
+        if kind == "subtitle":
+            # Legenda em bitmap não converte para texto: vale a primeira utilizável
+            candidates = [
+                st for st in candidates
+                if allowed is ANY_CODEC or st.get("codec_name") in allowed or st.get("codec_name") in TEXT_SUBTITLES
+            ]
+        if not candidates:
+            continue
+        st = candidates[0] if kind == "subtitle" else max(candidates, key=_default_stream_score)
+        codec = st.get("codec_name")
+        action = "copy" if allowed is ANY_CODEC or codec in allowed else encoder
+        out_index = len(plan)
+        args += ["-map", f"0:{st['index']}", f"-c:{out_index}", action]
+        plan.append({"input_index": st["index"], "type": kind, "codec": codec, "action": action})
+
+    if not plan:
+        raise ValueError(f"Nenhum stream da entrada cabe em {output_format}")
+    return args, plan
+
+
+# Perfis de encode para /ffmpeg (usáveis junto com formatos simples em output_format)
+ENCODER_PROFILES = {
+    "mp3_320": {"format": "mp3", "args": ["-map", "0:a:0", "-c:a", "libmp3lame", "-b:a", "320k"]},
+    "mp3_128": {"format": "mp3", "args": ["-map", "0:a:0", "-c:a", "libmp3lame", "-b:a", "128k"]},
+    "mp3_voice": {"format": "mp3", "args": ["-map", "0:a:0", "-ac", "1", "-c:a", "libmp3lame", "-b:a", "64k"]},
+    "wav_16k": {"format": "wav", "args": ["-map", "0:a:0", "-ac", "1", "-ar", "16000", "-c:a", "pcm_s16le"]},
+    "wav_48k": {"format": "wav", "args": ["-map", "0:a:0", "-ar", "48000", "-c:a", "pcm_s24le"]},
+    "ogg_q6": {"format": "ogg", "args": ["-map", "0:a:0", "-c:a", "libvorbis", "-q:a", "6"]},
+    "opus_voice": {"format": "opus", "args": ["-map", "0:a:0", "-ac", "1", "-c:a", "libopus", "-b:a", "48k", "-application", "voip"]},
+    "aac_192": {"format": "m4a", "args": ["-map", "0:a:0", "-c:a", "aac", "-b:a", "192k"]},
+    "mp4_720p": {"format": "mp4", "args": [
+        "-map", "0:v:0", "-map", "0:a:0?", "-vf", "scale=-2:720",
+        "-c:v", "libx264", "-preset", "veryfast", "-crf", "23",
+        "-c:a", "aac", "-b:a", "128k", "-movflags", "+faststart"
+    ]},
+}
+
+
+def parse_targets(output_format):
+    """
+    output_format do /ffmpeg: formatos e/ou perfis separados por vírgula.
+    Retorna [{"name", "format", "profile"}] sem repetições; ValueError se vazio.
+    """
+    targets, seen = [], set()
+    for item in re.split(r"[,\s]+", output_format.lower()):
+        item = item.lstrip(".")
+        if not item or item in seen:
+            continue
+        seen.add(item)
+        if item in ENCODER_PROFILES:
+            targets.append({"name": item, "format": ENCODER_PROFILES[item]["format"], "profile": item})
+        else:
+            targets.append({"name": item, "format": item, "profile": None})
+    if not targets:
+        raise ValueError("Informe output_format")
+    return targets
+
+
+def describe_plan(plan):
+    # Resumo para o cabeçalho da resposta: "0:video:h264=copy;1:audio:opus=aac"
+    return ";".join(f"{p['input_index']}:{p['type']}:{p['codec']}={p['action']}" for p in plan)
+
+# Conversões simultâneas no modo pipe (mesmo limite do pool "ffmpeg")
+_ffmpeg_slots = asyncio.Semaphore(FFMPEG_WORKERS)
+
+
+def remove_files(*paths):
+    for path in paths:
+        if path and os.path.exists(path):
+            os.remove(path)
+
+
+class FfmpegStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse do ffmpeg. on_close (síncrono) roda sempre que a resposta
+    termina, inclusive quando o cliente desconecta e o Starlette cancela a task
+    (antes ou durante o corpo). Com listen_disconnect=False a resposta não lê
+    o receive() à espera de desconexão: o corpo da requisição ainda está sendo
+    consumido (e enviado ao ffmpeg) enquanto a resposta sai.
+    """
+
+    def __init__(self, *args, on_close=None, listen_disconnect=True, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.on_close = on_close
+        self.listen_disconnect = listen_disconnect
+
+    async def __call__(self, scope, receive, send):
+        try:
+            if self.listen_disconnect:
+                await super().__call__(scope, receive, send)
+            else:
+                await self.stream_response(send)
+                if self.background is not None:
+                    await self.background()
+        finally:
+            if self.on_close is not None:
+                self.on_close()
+
+
+async def _read_upload(upload):
+    while True:
+        chunk = await upload.read(UPLOAD_CHUNK_BYTES)
+        if not chunk:
+            break
+        yield chunk
+
+
+async def stream_ffmpeg(cmd, media_type, filename, upload=None, cleanup=(), headers=None,
+                        job=None, tracker=None, source=None):
+    """
+    Roda o ffmpeg com saída em pipe:1 e devolve um StreamingResponse com o
+    stdout. A entrada pipe:0 vem de upload (UploadFile, já recebido pelo
+    FastAPI num arquivo temporário) ou de source (iterador assíncrono de bytes,
+    ex.: request.stream(), lido do socket enquanto a resposta sai).
+    Falhas antes do primeiro byte viram JSONResponse 500 com o stderr; os
+    arquivos de cleanup são apagados e o job é concluído quando o processo
+    termina ou o cliente desconecta.
+    Com tracker, o -progress vai para o stderr (o stdout é a mídia).
+    """
+    raw_body = source is not None
+    if upload is not None:
+        source = _read_upload(upload)
+
+    parser = None
+    if tracker is not None:
+        cmd = [cmd[0], "-progress", "pipe:2", "-nostats", *cmd[1:]]
+        parser = FfmpegProgressParser(tracker)
+
+    await _ffmpeg_slots.acquire()
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdin=asyncio.subprocess.PIPE if source is not None else asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+    except BaseException as e:
+        _ffmpeg_slots.release()
+        remove_files(*cleanup)
+        if job is not None:
+            render_scheduler.complete(job, error=str(e) or "Conversão cancelada")
+        raise
+
+    stderr_tail = bytearray()
+
+    async def feed_stdin():
+        try:
+            async for chunk in source:
+                proc.stdin.write(chunk)
+                await proc.stdin.drain()
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # o ffmpeg parou de ler (erro ou saída já encerrada)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Cliente desconectou ou passou do limite: a entrada está truncada
+            print(f"Entrada do ffmpeg interrompida ({filename}): {e!r}")
+            if proc.returncode is None:
+                proc.kill()
+        finally:
+            proc.stdin.close()
+
+    async def read_stderr():
+        while True:
+            line = await proc.stderr.readline()
+            if not line:
+                break
+            if parser is not None and parser.feed(line.decode("utf-8", "replace")):
+                continue
+            stderr_tail.extend(line)
+            del stderr_tail[:-8192]  # só o fim interessa
+
+    tasks = [asyncio.create_task(read_stderr())]
+    if source is not None:
+        tasks.append(asyncio.create_task(feed_stdin()))
+
+    finished = False
+
+    def finish(error=None):
+        # Síncrono (nenhum await): roda inteiro mesmo dentro de uma task cancelada.
+        # O processo morto é recolhido pelo child watcher do asyncio.
+        nonlocal finished
+        if finished:
+            return
+        finished = True
+        if proc.returncode is None:
+            error = error or "Conversão interrompida (cliente desconectou)"
+            try:
+                proc.kill()
+            except ProcessLookupError:
+                pass
+        elif proc.returncode != 0:
+            error = f"Erro FFmpeg (código {proc.returncode})"
+        for task in tasks:
+            task.cancel()
+        _ffmpeg_slots.release()
+        remove_files(*cleanup)
+        if job is not None:
+            encode = tracker.finish() if tracker is not None else None
+            render_scheduler.complete(job, result={"filename": filename, "encode": encode}, error=error)
+
+    try:
+        # Espera o primeiro bloco: erros de entrada/formato ainda podem virar um 500 de verdade
+        first = await proc.stdout.read(PIPE_CHUNK_BYTES)
+        if not first:
+            await proc.wait()
+            await tasks[0]
+            if proc.returncode != 0:
+                finish()
+                return JSONResponse({"error": f"Erro FFmpeg: {stderr_tail.decode('utf-8', 'replace')}"}, status_code=500)
+    except BaseException:
+        finish("Conversão cancelada antes do primeiro byte")
+        raise
+
+    async def body():
+        try:
+            if first:
+                yield first
+            while True:
+                chunk = await proc.stdout.read(PIPE_CHUNK_BYTES)
+                if not chunk:
+                    break
+                yield chunk
+            await proc.wait()
+            if proc.returncode != 0:
+                # Cabeçalhos já enviados: resta registrar
+                print(f"Erro FFmpeg (stream {filename}): {stderr_tail.decode('utf-8', 'replace')}")
+        finally:
+            finish()
+
+    return FfmpegStreamingResponse(
+        body(), media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"', **(headers or {})},
+        on_close=finish,
+        listen_disconnect=not raw_body
+    )
+
+
+def probe_duration(probe):
+    # Duração do contêiner no resultado do ffprobe (None se desconhecida)
+    try:
+        return float(probe["format"]["duration"])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def write_outputs_zip(zip_path, work_dir, outputs, manifest):
+    # zip sem compressão: as saídas já são mídia comprimida. Bloqueante.
+    with zipfile.ZipFile(zip_path, "w", compression=zipfile.ZIP_STORED) as zf:
+        for out in outputs:
+            zf.write(os.path.join(work_dir, out["name"]), out["name"])
+        zf.writestr("manifest.json", json.dumps(manifest, ensure_ascii=False, indent=2))
+
+
+async def convert_multi(input_path, targets, base, remux=True, delivery="zip", job=None):
+    """
+    Gera todas as saídas numa única execução do ffmpeg (uma leitura e uma
+    decodificação da entrada, um encode por saída). Uma saída volta como
+    arquivo; várias, como zip ou manifest (arquivos em OUTPUT_DIR/conversions).
+    Apaga input_path no fim e conclui o job com as métricas do encode.
+    """
+    conversion_id = uuid.uuid4().hex
+    work_dir = os.path.join(UPLOAD_DIR, ".conversions", conversion_id)
+    os.makedirs(work_dir, exist_ok=True)
+    try:
+        probe = await run_in_pool("ffmpeg", ffprobe, input_path)
+
+        cmd = ["ffmpeg", "-y", "-hide_banner", "-nostdin", "-i", input_path]
+        outputs = []
+        for target in targets:
+            suffix = f"_{target['profile']}" if target["profile"] else ""
+            name = f"{base}{suffix}.{target['format']}"
+            plan = None
+            if target["profile"]:
+                args = ENCODER_PROFILES[target["profile"]]["args"]
+            elif remux and target["format"] in CONTAINER_CODECS:
+                try:
+                    args, plan = plan_conversion(probe, target["format"])
+                except ValueError as e:
+                    shutil.rmtree(work_dir, ignore_errors=True)
+                    remove_files(input_path)
+                    return JSONResponse({"error": str(e)}, status_code=400)
+            else:
+                args = []  # seleção padrão de streams do ffmpeg
+            cmd += [*args, os.path.join(work_dir, name)]
+            outputs.append({
+                "name": name,
+                "format": target["format"],
+                "profile": target["profile"],
+                "plan": describe_plan(plan) if plan else None
+            })
+
+        reporter = ProgressReporter(progress_store(), job.id) if job else None
+        tracker = EncodeProgress(reporter, f"ffmpeg {base}", duration=probe_duration(probe), stage="ffmpeg")
+        inicio = time.perf_counter()
+        encode = await run_in_pool("ffmpeg", run_ffmpeg_render, cmd, tracker)
+        elapsed = round(time.perf_counter() - inicio, 2)
+        remove_files(input_path)
+        if job is not None:
+            render_scheduler.complete(job, result={"outputs": [o["name"] for o in outputs], "encode": encode})
+
+        if len(outputs) == 1:
+            path = os.path.join(work_dir, outputs[0]["name"])
+            return FileResponse(
+                path, filename=outputs[0]["name"],
+                background=BackgroundTask(shutil.rmtree, work_dir, ignore_errors=True)
+            )
+
+        if delivery == "manifest":
+            dest_dir = os.path.join(OUTPUT_DIR, "conversions", conversion_id)
+            os.makedirs(os.path.dirname(dest_dir), exist_ok=True)
+            # Entre discos o move vira cópia: fora do event loop
+            await run_in_pool("ffmpeg", shutil.move, work_dir, dest_dir)
+            for out in outputs:
+                out["path"] = os.path.join(dest_dir, out["name"])
+                out["size"] = os.path.getsize(out["path"])
+            return JSONResponse({
+                "message": f"✅ {len(outputs)} saídas geradas",
+                "id": conversion_id,
+                "seconds": elapsed,
+                "encode": encode,
+                "outputs": outputs
+            })
+
+        # zip (GBs no caso de vídeo) montado fora do event loop
+        zip_path = f"{work_dir}.zip"
+        manifest = {"seconds": elapsed, "encode": encode, "outputs": outputs}
+        await run_in_pool("ffmpeg", write_outputs_zip, zip_path, work_dir, outputs, manifest)
+        shutil.rmtree(work_dir, ignore_errors=True)
+        return FileResponse(
+            zip_path, filename=f"{base}.zip", media_type="application/zip",
+            background=BackgroundTask(remove_files, zip_path)
+        )
+    except BaseException:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        remove_files(input_path)
+        raise
+
+
+@app.post("/ffmpeg")
+async def convert_media(
+    file: UploadFile = File(...),
+    output_format: str = Form("mp3"),
+    stream: bool = Form(True),  # False: sempre via arquivo temporário
+    remux: bool = Form(True),  # copia (sem reencode) os streams que já cabem no contêiner de saída
+    delivery: str = Form("zip")  # várias saídas: "zip" (download) ou "manifest" (arquivos em OUTPUT_DIR)
+):
+    """
+    Converte qualquer arquivo de mídia usando FFmpeg.
+    Exemplo: POST /ffmpeg com 'file=@video.mp4' e 'output_format=wav'
+    Formatos que o ffmpeg escreve sem seek (mp3, wav, ogg, flac, mkv...) saem em
+    streaming do stdout; os demais (ex.: mp4) passam por arquivo temporário.
+    Com remux, a entrada é analisada com ffprobe e só os streams que não cabem
+    no contêiner de saída são reencodados (ex.: mkv h264/aac -> mp4 é só cópia).
+    output_format aceita vários formatos/perfis ("mp3,wav,ogg" ou "mp3_320,wav_16k",
+    veja /ffmpeg/profiles): todos saem de uma única execução do ffmpeg.
+    Cada conversão vira um job (X-Job-Id): /jobs/<id>/progress mostra frames,
+    fps, velocidade, bitrate e ETA enquanto o ffmpeg roda.
+    """
+    job = render_scheduler.track("ffmpeg")
+    response = await _convert_media(job, file, output_format, stream, remux, delivery)
+    response.headers["X-Job-Id"] = job.id
+    if not job.done.is_set() and not isinstance(response, StreamingResponse):
+        # Erros antes do encode (o streaming conclui o job quando o ffmpeg termina)
+        render_scheduler.complete(job, error=json.loads(response.body).get("error", f"HTTP {response.status_code}"))
+    return response
+
+
+async def _convert_media(job, file, output_format, stream, remux, delivery):
+    input_path = output_path = None
+    try:
+        try:
+            targets = parse_targets(output_format)
+        except ValueError as e:
+            return JSONResponse({"error": str(e)}, status_code=400)
+        if delivery not in ("zip", "manifest"):
+            return JSONResponse({"error": f"delivery inválido: {delivery}"}, status_code=400)
+
+        base = re.sub(r"[^A-Za-z0-9._-]+", "_", os.path.splitext(os.path.basename(file.filename or ""))[0]) or "output"
+        if file.size is not None and file.size > MAX_UPLOAD_BYTES:
+            raise UploadTooLarge(f"Arquivo excede o limite de {MAX_UPLOAD_MB} MB")
+
+        if len(targets) > 1 or targets[0]["profile"]:
+            # Várias saídas (ou perfil): uma decodificação, N encodes
+            input_path = os.path.join(UPLOAD_DIR, f"{uuid.uuid4()}_{file.filename}")
+            await save_upload(file, input_path)
+            return await convert_multi(input_path, targets, base, remux=remux, delivery=delivery, job=job)
+
+        output_format = targets[0]["format"]
+        filename = f"{base}.{output_format}"
+
+        # Entrada: stdin, exceto formatos que o ffmpeg só lê com seek e
+        # conversões planejadas pelo ffprobe (a entrada é lida duas vezes)
+        plan_remux = remux and output_format in CONTAINER_CODECS
+        pipe_input = os.path.splitext(file.filename or "")[1].lower() not in SEEKABLE_INPUTS
+        if not (stream and pipe_input) or plan_remux:
+            input_path = os.path.join(UPLOAD_DIR, f"{uuid.uuid4()}_{file.filename}")
+            await save_upload(file, input_path)
+
+        codec_args, headers, probe = [], {}, None
+        if input_path:
+            probe = await run_in_pool("ffmpeg", ffprobe, input_path)
+        if plan_remux:
+            try:
+                codec_args, plan = plan_conversion(probe, output_format)
+            except ValueError as e:
+                remove_files(input_path)
+                return JSONResponse({"error": str(e)}, status_code=400)
+            headers["X-Conversion-Plan"] = describe_plan(plan)
+
+        tracker = EncodeProgress(
+            ProgressReporter(progress_store(), job.id), f"ffmpeg {filename}",
+            duration=probe_duration(probe) if probe else None, stage="ffmpeg"
+        )
+
+        if stream and output_format in PIPE_FORMATS:
+            muxer, media_type = PIPE_FORMATS[output_format]
+            cmd = ["ffmpeg", "-hide_banner"]
+            if input_path:
+                cmd.append("-nostdin")
+            cmd += ["-i", input_path or "pipe:0", *codec_args, "-f", muxer, "pipe:1"]
+            return await stream_ffmpeg(
+                cmd, media_type, filename,
+                upload=None if input_path else file,
+                cleanup=(input_path,),
+                headers=headers,
+                job=job,
+                tracker=tracker
+            )
+
+        if input_path is None:
+            input_path = os.path.join(UPLOAD_DIR, f"{uuid.uuid4()}_{file.filename}")
+            await save_upload(file, input_path)
+        output_path = f"{os.path.splitext(input_path)[0]}.{output_format}"
+
+        if probe is None:
+            probe = await run_in_pool("ffmpeg", ffprobe, input_path)
+            tracker.duration = probe_duration(probe)
+
+        cmd = ["ffmpeg", "-y", "-i", input_path, *codec_args, output_path]
+        encode = await run_in_pool("ffmpeg", run_ffmpeg_render, cmd, tracker)
+        render_scheduler.complete(job, result={"filename": filename, "encode": encode})
+
+        os.remove(input_path)
+        # Saída temporária: apagada assim que a resposta termina de ser enviada
+        return FileResponse(
+            output_path, filename=filename, headers=headers,
+            background=BackgroundTask(remove_files, output_path)
+        )
+
+    except UploadTooLarge as e:
+        remove_files(input_path, output_path)
+        return JSONResponse({"error": str(e)}, status_code=413)
+    except Exception as e:
+        remove_files(input_path, output_path)
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+
+@app.post("/ffmpeg/stream")
+async def convert_media_stream(request: Request, output_format: str = "mp3", filename: str = "input"):
+    """
+    Variante do /ffmpeg com o corpo cru da requisição (não multipart) como
+    entrada: os bytes vão do socket direto para o stdin do ffmpeg, sem arquivo
+    temporário, e a conversão começa antes de o upload terminar. Só saídas em
+    pipe (PIPE_FORMATS) e entradas lidas sem seek; sem remux (o ffprobe
+    precisaria do arquivo inteiro). filename só dá nome à saída.
+    Exemplo: curl --data-binary @audio.wav "http://<pod>/ffmpeg/stream?output_format=mp3&filename=audio.wav"
+    """
+    if output_format not in PIPE_FORMATS:
+        return JSONResponse({"error": f"output_format sem saída em pipe: {output_format} (use /ffmpeg)"}, status_code=400)
+    if os.path.splitext(filename)[1].lower() in SEEKABLE_INPUTS:
+        return JSONResponse({"error": f"Entrada precisa de seek: {filename} (use /ffmpeg)"}, status_code=400)
+
+    base = re.sub(r"[^A-Za-z0-9._-]+", "_", os.path.splitext(os.path.basename(filename))[0]) or "output"
+    out_name = f"{base}.{output_format}"
+    job = render_scheduler.track("ffmpeg")
+    tracker = EncodeProgress(ProgressReporter(progress_store(), job.id), f"ffmpeg {out_name}", stage="ffmpeg")
+    muxer, media_type = PIPE_FORMATS[output_format]
+    cmd = ["ffmpeg", "-hide_banner", "-i", "pipe:0", "-f", muxer, "pipe:1"]
+    try:
+        return await stream_ffmpeg(
+            cmd, media_type, out_name,
+            source=request.stream(),
+            headers={"X-Job-Id": job.id},
+            job=job,
+            tracker=tracker
+        )
+    except Exception as e:
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+
+@app.get("/ffmpeg/profiles")
+def list_encoder_profiles():
+    """
+    Perfis de encode aceitos em output_format do /ffmpeg.
+    """
+    return {name: {"format": p["format"], "args": " ".join(p["args"])} for name, p in ENCODER_PROFILES.items()}
+
+
+# ========================
+# 📤 ENDPOINT: /upload
+# ========================
+@app.post("/upload")
+async def upload_file(
+    file: UploadFile = File(None),
+    sha256: str = Form(None),
+    filename: str = Form(None)
+):
+    """
+    Salva um arquivo no store de /workspace/uploads/ (deduplicado por sha256).
+    Sem 'file' e com 'sha256' de um conteúdo já conhecido, apenas registra
+    uma nova referência (nada é transferido).
+    """
+    try:
+        if file is None:
+            if not sha256:
+                return JSONResponse({"status": "error", "message": "Envie 'file' ou 'sha256'"}, status_code=400)
+            try:
+                meta = await run_in_threadpool(upload_store.add_ref, sha256, filename)
+            except KeyError:
+                return JSONResponse({"status": "error", "message": f"Conteúdo desconhecido: {sha256}"}, status_code=404)
+            deduplicated = True
+        else:
+            temp_path = upload_store.new_temp_path()
+            size, digest = await save_upload(file, temp_path)
+            if sha256 and sha256.removeprefix("sha256:") != digest:
+                os.remove(temp_path)
+                return JSONResponse({"status": "error", "message": "sha256 não confere com o conteúdo enviado"}, status_code=400)
+            # add_file regrava o índice inteiro: fora do event loop
+            meta, deduplicated = await run_in_threadpool(
+                upload_store.add_file, temp_path, digest, size, filename or file.filename
+            )
+
+        return JSONResponse({
+            "status": "success",
+            "filename": filename or (file.filename if file else None),
+            "saved_as": f"sha256:{meta['sha256']}",
+            "path": meta["path"],
+            "size": meta["size"],
+            "sha256": meta["sha256"],
+            "deduplicated": deduplicated,
+            "refcount": meta["refcount"]
+        })
+
+    except UploadTooLarge as e:
+        return JSONResponse({"status": "error", "message": str(e)}, status_code=413)
+    except Exception as e:
+        return JSONResponse({"status": "error", "message": str(e)}, status_code=500)
+
+
+@app.get("/upload/{ref}")
+async def upload_info(ref: str, media: bool = False):
+    """
+    Metadados de um arquivo do store (por hash ou nome). Útil para checar se
+    um conteúdo já existe antes de enviá-lo. Com media=true inclui duração,
+    sample rate, streams e dimensões (ffprobe, em cache por conteúdo).
+    """
+    meta = upload_store.info(ref)
+    if meta is None:
+        return JSONResponse({"status": "error", "message": f"Não encontrado: {ref}"}, status_code=404)
+    if media:
+        try:
+            meta = {**meta, "media": await run_in_pool("ffmpeg", media_info.get, upload_store.resolve(ref), meta["sha256"])}
+        except Exception as e:
+            return JSONResponse({"status": "error", "message": str(e)}, status_code=400)
+    return meta
+
+
+@app.delete("/upload/{ref}")
+def upload_release(ref: str):
+    """
+    Remove uma referência; o arquivo é apagado quando ninguém mais o usa.
+    """
+    try:
+        meta = upload_store.release(ref)
+    except KeyError:
+        return JSONResponse({"status": "error", "message": f"Não encontrado: {ref}"}, status_code=404)
+    return {"status": "success", "sha256": meta["sha256"], "refcount": max(meta["refcount"], 0)}
+
+
+# ========================
+# 📏 METADADOS DE MÍDIA (ffprobe em cache por conteúdo)
+# ========================
+def summarize_probe(probe):
+    """
+    Resumo do ffprobe usado no planejamento: duração, formato, streams e, do
+    primeiro stream de cada tipo, sample rate/canais (áudio) e dimensões (vídeo/imagem).
+    """
+    streams = []
+    for stream in probe.get("streams", []):
+        entry = {
+            "index": stream.get("index"),
+            "type": stream.get("codec_type"),
+            "codec": stream.get("codec_name"),
+        }
+        if entry["type"] == "audio":
+            entry["sample_rate"] = int(stream.get("sample_rate") or 0) or None
+            entry["channels"] = stream.get("channels")
+            entry["channel_layout"] = stream.get("channel_layout")
+        elif entry["type"] == "video":
+            entry["width"] = stream.get("width")
+            entry["height"] = stream.get("height")
+        if stream.get("duration") not in (None, "N/A"):
+            entry["duration"] = float(stream["duration"])
+        streams.append(entry)
+
+    audio = next((s for s in streams if s["type"] == "audio"), {})
+    video = next((s for s in streams if s["type"] == "video"), {})
+    duration = probe_duration(probe)
+    if duration is None:
+        # Alguns contêineres só informam a duração nos streams
+        duration = max((s["duration"] for s in streams if "duration" in s), default=None)
+    fmt = probe.get("format", {})
+    return {
+        "duration": duration,
+        "format": fmt.get("format_name"),
+        "size": int(fmt["size"]) if fmt.get("size") else None,
+        "sample_rate": audio.get("sample_rate"),
+        "channels": audio.get("channels"),
+        "width": video.get("width"),
+        "height": video.get("height"),
+        "streams": streams,
+    }
+
+
+class MediaInfoCache:
+    """
+    Metadados de mídia (summarize_probe) por sha256 do conteúdo: um ffprobe por
+    arquivo, guardado em memória e em JSON no disco para que os processos de
+    render reaproveitem o que a API já leu. Substitui abrir um AudioFileClip
+    só para saber a duração.
+    """
+
+    VERSION = 1
+    MEMORY_ENTRIES = 4096
+
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _path(self, digest):
+        return os.path.join(self.root, digest[:2], f"{digest}.json")
+
+    def _remember(self, digest, info):
+        with self._lock:
+            self._memory[digest] = info
+            self._memory.move_to_end(digest)
+            while len(self._memory) > self.MEMORY_ENTRIES:
+                self._memory.popitem(last=False)
+
+    def get(self, path, digest=None):
+        """
+        Metadados do arquivo (bloqueante na primeira vez: hash + ffprobe).
+        RuntimeError se o ffprobe não reconhece o arquivo.
+        """
+        digest = (digest or file_sha256(path)).removeprefix("sha256:")
+        with self._lock:
+            info = self._memory.get(digest)
+            if info is not None:
+                self._memory.move_to_end(digest)
+                return info
+
+        cache_path = self._path(digest)
+        try:
+            with open(cache_path, "r", encoding="utf-8") as f:
+                stored = json.load(f)
+            if stored.get("version") == self.VERSION:
+                self._remember(digest, stored["info"])
+                return stored["info"]
+        except (FileNotFoundError, ValueError, KeyError):
+            pass
+
+        info = summarize_probe(ffprobe(path))
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        tmp_path = f"{cache_path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": self.VERSION, "info": info}, f)
+        os.replace(tmp_path, cache_path)
+        self._remember(digest, info)
+        return info
+
+
+media_info = MediaInfoCache(os.path.join(CACHE_DIR, "media_info"))
+
+
+# ========================
+# 🧪 ENCODERS DISPONÍVEIS (GPU com fallback para CPU)
+# ========================
+# Encoders de vídeo por família, do mais rápido ao mais lento
+ENCODER_FAMILIES = {
+    "h264": ["h264_nvenc", "libx264"],
+    "hevc": ["hevc_nvenc", "libx265"],
+}
+
+# Presets NVENC (p1 = mais rápido) e os equivalentes do x264/x265
+NVENC_TO_X264_PRESETS = {
+    "p1": "ultrafast", "p2": "superfast", "p3": "veryfast", "p4": "faster",
+    "p5": "fast", "p6": "medium", "p7": "slow",
+    # nomes antigos do NVENC
+    "fast": "fast", "medium": "medium", "slow": "slow", "hq": "medium", "hp": "veryfast",
+    "default": "medium", "ll": "veryfast", "llhq": "fast", "llhp": "superfast",
+}
+X264_TO_NVENC_PRESETS = {
+    "ultrafast": "p1", "superfast": "p2", "veryfast": "p3", "faster": "p4",
+    "fast": "p5", "medium": "p6", "slow": "p7", "slower": "p7", "veryslow": "p7", "placebo": "p7",
+}
+
+
+def encoder_family(codec):
+    for family, encoders in ENCODER_FAMILIES.items():
+        if codec in encoders:
+            return family
+    return None
+
+
+def is_nvenc(codec):
+    return codec.endswith("_nvenc")
+
+
+@functools.lru_cache(maxsize=None)
+def encoder_capabilities():
+    """
+    Tabela encoder -> utilizável, feita uma vez por processo: o encoder precisa
+    aparecer em `ffmpeg -encoders` e passar num encode de teste (o NVENC é
+    compilado no ffmpeg mas falha sem GPU/driver). Vazia se o ffmpeg não roda.
+    """
+    try:
+        listing = subprocess.run(["ffmpeg", "-hide_banner", "-encoders"], capture_output=True, text=True, timeout=30)
+    except (OSError, subprocess.TimeoutExpired):
+        return {}
+    listed = set(re.findall(r"^\s*V\S*\s+(\S+)", listing.stdout, re.M))
+
+    caps = {}
+    for encoders in ENCODER_FAMILIES.values():
+        for codec in encoders:
+            if codec not in listed:
+                caps[codec] = False
+                continue
+            test = [
+                "ffmpeg", "-hide_banner", "-nostdin", "-f", "lavfi", "-i", "color=black:s=256x256:r=30",
+                "-frames:v", "1", "-pix_fmt", "yuv420p", "-c:v", codec, "-f", "null", "-",
+            ]
+            try:
+                caps[codec] = subprocess.run(test, capture_output=True, timeout=60).returncode == 0
+            except subprocess.TimeoutExpired:
+                caps[codec] = False
+    print("🧪 Encoders:", ", ".join(f"{c}={'ok' if ok else 'indisponível'}" for c, ok in caps.items()))
+    return caps
+
+
+def translate_preset(preset, target):
+    # Traduz pelo vocabulário do preset (NVENC ou x264/x265), não pelo codec pedido:
+    # codec=libx264 com o preset padrão p6 também precisa virar "medium"
+    if is_nvenc(target):
+        return X264_TO_NVENC_PRESETS.get(preset, preset)
+    if encoder_family(target) is not None:
+        return NVENC_TO_X264_PRESETS.get(preset, preset)
+    return preset
+
+
+def resolve_encoder(codec, preset):
+    """
+    Escolhe o encoder mais rápido disponível da família pedida (o próprio
+    codec, se funcionar) e traduz o preset. Retorna {"requested", "codec",
+    "preset", "fallback"}. ValueError se a família não tem encoder utilizável.
+    """
+    caps = encoder_capabilities()
+    chosen = codec
+    family = encoder_family(codec)
+    if caps and not caps.get(codec, True):
+        usable = [c for c in ENCODER_FAMILIES.get(family, []) if caps.get(c)]
+        if not usable:
+            raise ValueError(f"Nenhum encoder disponível para {codec}")
+        chosen = usable[0]
+    return {
+        "requested": codec,
+        "codec": chosen,
+        "preset": translate_preset(preset, chosen),
+        "fallback": chosen != codec,
+    }
+
+
+def youtube_video_params(codec="h264_nvenc"):
+    """
+    Parâmetros de vídeo do encode YouTube (compartilhados pelos dois backends),
+    com o controle de taxa traduzido para o encoder: VBR com -cq no NVENC,
+    CRF limitado por -maxrate/-bufsize no x264/x265.
+    """
+    if is_nvenc(codec):
+        rate_control = [
+            "-gpu", "0",
+            "-rc", "vbr",
+            "-cq", "19",  # YouTube comprime, então qualidade alta
+            "-b:v", "8M",  # 8Mbps ideal para 1080p no YouTube
+        ]
+    else:
+        rate_control = ["-crf", "19"]  # mesma qualidade alvo do -cq 19
+    profile = "main" if encoder_family(codec) == "hevc" else "high"  # Profile alto para melhor qualidade
+    return [
+        "-pix_fmt", "yuv420p",
+        *rate_control,
+        "-maxrate", "12M",
+        "-bufsize", "16M",
+        "-profile:v", profile,
+        "-level", "4.2",
+    ]
+
+
+def log_encoder_fallback(encoder):
+    if encoder["fallback"]:
+        print(f"🧪 {encoder['requested']} indisponível: usando {encoder['codec']} (preset {encoder['preset']})")
+
+
+@app.on_event("startup")
+async def detect_encoders():
+    # Sonda os encoders uma vez, antes do primeiro render
+    await run_in_pool("ffmpeg", encoder_capabilities)
+
+
+@app.get("/encoders")
+def list_encoders():
+    """
+    Encoders de vídeo detectados e a escolha feita para cada família.
+    """
+    caps = encoder_capabilities()
+    return {
+        "encoders": caps,
+        "families": {
+            family: next((c for c in encoders if caps.get(c)), None)
+            for family, encoders in ENCODER_FAMILIES.items()
+        }
+    }
+
+
+# ========================
+# 🎞 ENDPOINT: /ffmpeg_ken (MoviePy + NVENC)
+# ========================
+def kenburns(img_path, duration=4, zoom_factor=1.3):
+    """
+    Aplica efeito Ken Burns (zoom/pan suave) com duração garantida.
+    """
+    clip = ImageClip(img_path).resize(height=1080).set_duration(duration)
+    w, h = clip.size
+
+    zoom = random.uniform(1.0, zoom_factor)
+    start_x = random.uniform(0, w * (zoom - 1))
+    start_y = random.uniform(0, h * (zoom - 1))
+
+    return (
+        clip.crop(x1=start_x, y1=start_y, x2=start_x + w / zoom, y2=start_y + h / zoom)
+        .resize((1920, 1080))
+        .fadein(1)
+        .fadeout(1)
+    )
+
+
+def render_kenburns(imagens, audio_path, output_path, codec="h264_nvenc", preset="p5",
+                    duracao_audio=None, progress=None):
+    """
+    Renderiza o vídeo do /ffmpeg_ken. Roda no pool de render (processo separado).
+    codec/preset já resolvidos por resolve_encoder (GPU ou fallback em CPU).
+    """
+    if progress:
+        progress(0.0, "preparando")
+    if duracao_audio is None:
+        duracao_audio = audio_duration(audio_path)
+    num_imagens = len(imagens)
+    duracao_por_imagem = max(duracao_audio / num_imagens, 0.1)  # evita duração zero
+
+    clips = [kenburns(img, duration=duracao_por_imagem) for img in imagens if os.path.exists(img)]
+    if not clips:
+        raise RuntimeError("Nenhum clipe válido gerado.")
+
+    # Define FPS fixo para todo o vídeo
+    fps_final = 30
+
+    # Clipes do mesmo tamanho e sem máscara: "chain" evita compor cada frame sobre um fundo
+    video = concatenate_videoclips(clips, method="chain").set_duration(duracao_audio).set_fps(fps_final)
+
+    # Áudio aberto só para o mux
+    audio = AudioFileClip(audio_path)
+    final = video.set_audio(audio)
+
+    if progress:
+        progress(0.1, "encode")
+    tracker = EncodeProgress(progress, f"ffmpeg_ken {os.path.basename(output_path)}", duration=final.duration,
+                             fps=fps_final, base=0.1, span=0.9, output_path=output_path)
+    final.write_videofile(
+        output_path,
+        fps=fps_final,                   # 👈 FPS explícito (corrige o erro)
+        codec=codec,                     # GPU (ou CPU, ver resolve_encoder)
+        audio_codec="aac",
+        preset=preset,
+        ffmpeg_params=["-pix_fmt", "yuv420p"],
+        threads=2,
+        logger=MoviePyProgressLogger(tracker)
+    )
+
+    audio.close()
+    final.close()
+
+    return {
+        "imagens": num_imagens,
+        "tempo_por_imagem": round(duracao_por_imagem, 2),
+        "duracao_audio": round(duracao_audio, 2),
+        "backend": "moviepy",
+        "encoder": codec,
+        "preset": preset,
+        "encode": tracker.finish(),
+        "output": output_path
+    }
+
+
+@app.post("/ffmpeg_ken")
+async def gerar_video_kenburns(
+    audio_file: str = Form(...),
+    image_pattern: str = Form(None),
+    image_hashes: str = Form(None),  # alternativa ao pattern: hashes/nomes do store, em ordem
+    output_name: str = Form("video_final.mp4"),
+    backend: str = Form("moviepy"),  # "moviepy" ou "ffmpeg" (filtergraph nativo)
+    parallel: bool = Form(False),  # True: um segmento por imagem em paralelo (backend moviepy)
+    codec: str = Form("h264_nvenc"),  # sem GPU, cai para o libx264 (ver /encoders)
+    preset: str = Form("p5"),
+    async_job: bool = Form(False),  # True: responde 202 com job_id (ver /jobs)
+    priority: int = Form(0)  # maior = sai antes da fila
+):
+    """
+    Gera vídeo com Ken Burns real (zoom/pan em cada imagem),
+    sincronizado com o áudio e renderizado em GPU (NVENC), ou em CPU
+    (libx264 com preset equivalente) quando o NVENC não está disponível.
+    """
+    try:
+        if not image_pattern and not image_hashes:
+            return JSONResponse({"error": "Informe image_pattern ou image_hashes"}, status_code=400)
+
+        audio_path = resolve_upload(audio_file)
+        output_path = os.path.join(OUTPUT_DIR, output_name)
+        os.makedirs(OUTPUT_DIR, exist_ok=True)
+
+        imagens, missing = resolve_images(image_pattern, image_hashes)
+        if missing:
+            return JSONResponse({"error": f"Imagens não encontradas no store: {missing}"}, status_code=400)
+        if not imagens:
+            return JSONResponse({"error": f"Nenhuma imagem encontrada em {image_pattern}"}, status_code=400)
+
+        # Garante que o áudio foi carregado corretamente
+        if not os.path.exists(audio_path):
+            return JSONResponse({"error": f"Arquivo de áudio não encontrado: {audio_path}"}, status_code=400)
+        try:
+            duracao_audio = await run_in_pool("ffmpeg", audio_duration, audio_path)
+        except Exception as e:
+            return JSONResponse({"error": f"Erro ao ler áudio: {str(e)}"}, status_code=400)
+        if not duracao_audio or duracao_audio <= 0:
+            return JSONResponse({"error": f"Arquivo de áudio inválido ou corrompido: {audio_path}"}, status_code=400)
+
+        if backend not in ("moviepy", "ffmpeg"):
+            return JSONResponse({"error": f"Backend inválido: {backend}"}, status_code=400)
+        try:
+            encoder = resolve_encoder(codec, preset)
+        except ValueError as e:
+            return JSONResponse({"error": str(e)}, status_code=400)
+        log_encoder_fallback(encoder)
+
+        if backend == "ffmpeg":
+            render_fn, pool = render_kenburns_ffmpeg, "render"
+        elif parallel:
+            # O orquestrador só espera os segmentos: roda numa thread
+            render_fn, pool = render_kenburns_segmented, "ffmpeg"
+        else:
+            render_fn, pool = render_kenburns, "render"
+
+        return await run_render_job(
+            "ffmpeg_ken", render_fn,
+            dict(imagens=imagens, audio_path=audio_path, output_path=output_path,
+                 codec=encoder["codec"], preset=encoder["preset"], duracao_audio=duracao_audio),
+            priority, async_job,
+            "✅ Vídeo gerado com sucesso (Ken Burns real)!",
+            pool=pool
+        )
+
+    except Exception as e:
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+
+# ========================
+# 🎨 COLOR GRADING POR LUT
+# ========================
+# Cada grade é compilada uma vez numa tabela 256³ → RGB (uint8, 48 MB) salva em
+# CACHE_DIR/luts e aberta via mmap (compartilhada entre os processos de render).
+# Aplicar a grade numa imagem é um único lookup na tabela.
+LUT_DIR = os.path.join(UPLOAD_DIR, "luts")  # grades customizadas (.cube)
+LUT_CACHE_DIR = os.path.join(CACHE_DIR, "luts")
+LUT_VERSION = 1  # mude quando as grades embutidas mudarem
+os.makedirs(LUT_DIR, exist_ok=True)
+os.makedirs(LUT_CACHE_DIR, exist_ok=True)
+
+_LUMA = np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
+
+def _brightness(rgb, factor):
+    # ImageEnhance.Brightness: mistura com preto
+    return np.clip(rgb * factor, 0, 255)
+
+
+def _contrast(rgb, factor, pivot=128.0):
+    # ImageEnhance.Contrast usa a média da imagem como pivô; numa LUT o pivô é fixo (cinza médio)
+    return np.clip(pivot + factor * (rgb - pivot), 0, 255)
+
+
+def _saturation(rgb, factor):
+    # ImageEnhance.Color: mistura com a versão em tons de cinza
+    luma = (rgb @ _LUMA)[:, None]
+    return np.clip(luma + factor * (rgb - luma), 0, 255)
+
+
+def _teal_orange(rgb):
+    rgb = rgb.copy()
+    brightness = rgb.mean(axis=1)
+
+    # Sombras -> teal (cyan)
+    shadows = brightness < 85
+    rgb[shadows, 1:3] *= 1.08  # +verde +azul
+
+    # Highlights -> orange
+    highlights = brightness > 170
+    rgb[highlights, 0] *= 1.1  # +vermelho
+    rgb[highlights, 1] *= 1.05  # +verde
+    return np.clip(rgb, 0, 255)
+
+
+BUILTIN_GRADES = {
+    # Reduz brilho (20%), aumenta contraste (20%) e tira um pouco de saturação: estética dark
+    "dark": lambda rgb: _saturation(_contrast(_brightness(rgb, 0.8), 1.2), 0.9),
+    # Estilo cinema - Teal & Orange (estilo Hollywood/Netflix)
+    "cinematic": lambda rgb: _teal_orange(_saturation(_contrast(_brightness(rgb, 0.95), 1.15), 1.1)),
+    # Tom quente sutil
+    "warm": lambda rgb: _saturation(rgb, 1.1),
+    # Padrão - apenas leve ajuste de contraste
+    "neutral": lambda rgb: _contrast(rgb, 1.05),
+}
+
+
+def parse_cube(path):
+    """
+    Lê um arquivo .cube (Adobe/Resolve). Retorna (tamanho, dimensão, tabela, domínio).
+    Tabelas 3D vêm como [b][g][r] -> rgb (o vermelho varia mais rápido no arquivo).
+    """
+    size, dims = None, None
+    domain_min, domain_max = np.zeros(3, np.float32), np.ones(3, np.float32)
+    values = []
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#") or line.startswith("TITLE"):
+                continue
+            parts = line.split()
+            if parts[0] == "LUT_3D_SIZE":
+                size, dims = int(parts[1]), 3
+            elif parts[0] == "LUT_1D_SIZE":
+                size, dims = int(parts[1]), 1
+            elif parts[0] == "DOMAIN_MIN":
+                domain_min = np.array(parts[1:4], np.float32)
+            elif parts[0] == "DOMAIN_MAX":
+                domain_max = np.array(parts[1:4], np.float32)
+            elif parts[0][0].isdigit() or parts[0][0] in "-.":
+                values.append([float(v) for v in parts[:3]])
+
+    if size is None:
+        raise ValueError("Arquivo .cube sem LUT_3D_SIZE/LUT_1D_SIZE")
+    expected = size ** 3 if dims == 3 else size
+    if len(values) != expected:
+        raise ValueError(f"Arquivo .cube incompleto: {len(values)} de {expected} entradas")
+
+    table = np.array(values, dtype=np.float32)
+    if dims == 3:
+        table = table.reshape(size, size, size, 3)
+    return size, dims, table, (domain_min, domain_max)
+
+
+def cube_grade(path):
+    """
+    Função de grade (rgb float 0..255 -> rgb) a partir de um .cube, com interpolação trilinear.
+    """
+    size, dims, table, (domain_min, domain_max) = parse_cube(path)
+
+    def grade(rgb):
+        x = (rgb / 255.0 - domain_min) / (domain_max - domain_min) * (size - 1)
+        x = np.clip(x, 0, size - 1)
+        i0 = np.minimum(np.floor(x).astype(np.int32), size - 2)
+        frac = x - i0
+
+        if dims == 1:
+            out = np.empty_like(rgb)
+            for c in range(3):
+                lo, hi = table[i0[:, c], c], table[i0[:, c] + 1, c]
+                out[:, c] = lo + (hi - lo) * frac[:, c]
+            return np.clip(out * 255.0, 0, 255)
+
+        r0, g0, b0 = i0[:, 0], i0[:, 1], i0[:, 2]
+        fr, fg, fb = frac[:, 0:1], frac[:, 1:2], frac[:, 2:3]
+        out = np.zeros_like(rgb)
+        for db, wb in ((0, 1 - fb), (1, fb)):
+            for dg, wg in ((0, 1 - fg), (1, fg)):
+                for dr, wr in ((0, 1 - fr), (1, fr)):
+                    out += table[b0 + db, g0 + dg, r0 + dr] * (wb * wg * wr)
+        return np.clip(out * 255.0, 0, 255)
+
+    return grade
+
+
+def custom_grade_path(name):
+    return os.path.join(LUT_DIR, f"{name}.cube")
+
+
+def grade_signature(color_grade):
+    """
+    Identifica o conteúdo de uma grade (muda se a grade mudar), ou None se ela não existir.
+    """
+    if color_grade in BUILTIN_GRADES:
+        return f"builtin-{color_grade}-v{LUT_VERSION}"
+    path = custom_grade_path(color_grade)
+    if re.fullmatch(r"[A-Za-z0-9_-]+", color_grade or "") and os.path.exists(path):
+        return f"cube-{color_grade}-{file_sha256(path)[:16]}"
+    return None
+
+
+def compile_grade(fn):
+    """
+    Avalia a grade em todas as 256³ cores (em fatias, para limitar memória).
+    Índice da tabela: (r << 16) | (g << 8) | b.
+    """
+    table = np.empty((256 ** 3, 3), dtype=np.uint8)
+    g, b = np.meshgrid(np.arange(256, dtype=np.float32), np.arange(256, dtype=np.float32), indexing="ij")
+    rgb = np.stack([np.zeros(65536, np.float32), g.ravel(), b.ravel()], axis=1)
+    for r in range(256):
+        rgb[:, 0] = r
+        table[r * 65536:(r + 1) * 65536] = np.rint(fn(rgb))
+    return table
+
+
+def grade_table(color_grade):
+    """
+    Tabela compilada da grade (mmap do cache em disco), ou None para grade desconhecida.
+    """
+    signature = grade_signature(color_grade)
+    if signature is None:
+        return None
+    return _grade_table(color_grade, signature)
+
+
+@functools.lru_cache(maxsize=8)
+def _grade_table(color_grade, signature):
+    path = os.path.join(LUT_CACHE_DIR, f"{signature}.npy")
+    if not os.path.exists(path):
+        fn = BUILTIN_GRADES.get(color_grade) or cube_grade(custom_grade_path(color_grade))
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp.npy"
+        np.save(tmp_path, compile_grade(fn))
+        os.replace(tmp_path, path)
+    return np.load(path, mmap_mode="r")
+
+
+def apply_grade(rgb, table):
+    """
+    Aplica a grade com um único lookup uint8 na tabela 256³.
+    """
+    idx = rgb[..., 0].astype(np.uint32) << 16
+    idx |= rgb[..., 1].astype(np.uint32) << 8
+    idx |= rgb[..., 2]
+    return table[idx]
+
+
+def load_graded_image(img_path, color_grade="dark"):
+    """
+    Abre a imagem na resolução original (array RGB) e aplica o color grading.
+    A escala para 1080p fica a cargo do warp de cada frame.
+    """
+    with Image.open(img_path) as pil_img:
+        rgb = np.asarray(pil_img.convert('RGB'))
+
+    table = grade_table(color_grade)
+    if table is None:
+        return rgb
+    return apply_grade(rgb, table)
+
+
+@functools.lru_cache(maxsize=8)
+def vignette_mask(width, height, strength=0.5):
+    """
+    Máscara radial da vinheta em ponto fixo (uint16, 256 = sem escurecer),
+    calculada uma vez por resolução/intensidade e reaproveitada entre frames,
+    clipes e requisições do mesmo processo.
+    """
+    center_x, center_y = width // 2, height // 2
+    max_radius = math.sqrt(center_x**2 + center_y**2)
+
+    dy = np.arange(height, dtype=np.float32) - center_y
+    dx = np.arange(width, dtype=np.float32) - center_x
+    dist = np.sqrt(dy[:, None] ** 2 + dx[None, :] ** 2)
+
+    mask = np.clip(np.rint((1 - (dist / max_radius) * strength) * 256), 0, 256).astype(np.uint16)
+    mask = mask[:, :, None]
+    mask.setflags(write=False)
+    return mask
+
+
+def apply_vignette(frame, mask, out=None, scratch=None):
+    """
+    Escurece as bordas: uma multiplicação inteira pela máscara pré-calculada.
+    Com scratch (uint16, mesmo shape do frame) não aloca nada: o resultado vai
+    para out (pode ser o próprio frame).
+    """
+    if scratch is None:
+        return ((frame * mask) >> 8).astype(np.uint8)
+    np.multiply(frame, mask, out=scratch)
+    np.right_shift(scratch, 8, out=scratch)
+    if out is None:
+        out = np.empty_like(frame)
+    np.copyto(out, scratch, casting="unsafe")
+    return out
+
+
+MAX_MOTION_BLUR_TAPS = 8  # cada tap é um frame bruto a mais em memória por clipe
+
+
+def motion_blur_weights(amount=0.2, taps=2):
+    """
+    Pesos do motion blur em ponto fixo (somam 256): [atual, anterior, ...].
+    amount é a fração do peso que vai para os frames anteriores, dividida
+    igualmente entre eles (a sobra do arredondamento vai para os mais recentes).
+    """
+    taps = max(int(taps), 1)
+    amount = min(max(float(amount), 0.0), 1.0)
+    rest = round(256 * amount)
+    if taps == 1 or rest == 0:
+        return (256,)
+    share, extra = divmod(rest, taps - 1)
+    return (256 - rest, *(share + (1 if k < extra else 0) for k in range(taps - 1)))
+
+
+class KenBurnsFrames:
+    """
+    Gera os frames de um clipe Ken Burns sob demanda, dentro do make_frame.
+    Só os últimos frames brutos ficam em memória (o suficiente para o motion
+    blur), então o pico de memória não cresce com a duração do vídeo.
+
+    Warp, vinheta e motion blur escrevem em buffers alocados uma vez por clipe:
+    o array devolvido por frame() é reaproveitado no frame seguinte.
+    """
+
+    target_w, target_h = 1920, 1080
+
+    def __init__(self, img_path, duration=4, zoom_start=1.0, zoom_end=1.1, pan_strength=20,
+                 fps=30, vignette=True, color_grade="dark", vignette_strength=0.5,
+                 blur_amount=0.2, blur_taps=2):
+        self.img_path = img_path
+        self.duration = duration
+        self.zoom_start = zoom_start
+        self.zoom_end = zoom_end
+        self.pan_strength = pan_strength
+        self.fps = fps
+        self.color_grade = color_grade
+        self.blur_amount = blur_amount
+        self.weights = motion_blur_weights(blur_amount, blur_taps)
+        self.total_frames = max(int(duration * fps), 1)
+
+        # VIGNETTE (bordas escuras - estilo dark): máscara calculada uma vez só
+        self.mask = vignette_mask(self.target_w, self.target_h, vignette_strength) if vignette else None
+
+        self._src = None
+        self._base_scale = 1.0
+        # Janela do motion blur: anel de buffers com os frames brutos, slot = frame_idx % taps.
+        # Os frames de uma janela (idx-taps+1..idx) caem sempre em slots distintos, então
+        # num encode sequencial cada frame é renderizado (warp) uma única vez
+        self._lookback = len(self.weights)
+        self._ring = [None] * self._lookback
+        self._ring_idx = [-1] * self._lookback
+        self.warps = 0  # frames renderizados (deve ser total_frames num encode sequencial)
+        self._acc = None  # uint16: vinheta e soma ponderada do motion blur
+        self._tmp = None  # uint16: produto de um frame anterior pelo peso
+        self._out = None  # uint8: frame final
+
+    def _source(self):
+        # Carregada sob demanda; release() devolve a memória entre usos
+        if self._src is None:
+            print(f"Renderizando {self.total_frames} frames (YouTube Dark) para {self.img_path}...")
+            src = load_graded_image(self.img_path, self.color_grade)
+            h = src.shape[0]
+
+            # Escala da imagem original para o quadro de 1080 linhas (só amplia)
+            base_scale = 1080 / h if h < 1080 else 1.0
+
+            # Fonte maior que o necessário: reduz uma vez só (INTER_AREA, sem aliasing)
+            # para que o warp por frame trabalhe sempre perto de 1:1
+            max_scale = base_scale * max(self.zoom_start, self.zoom_end)
+            if max_scale < 1:
+                size = (max(round(src.shape[1] * max_scale), 1), max(round(h * max_scale), 1))
+                src = cv2.resize(src, size, interpolation=cv2.INTER_AREA)
+                base_scale = base_scale * h / src.shape[0]
+
+            self._src = np.ascontiguousarray(src)
+            self._base_scale = base_scale
+        return self._src
+
+    def release(self):
+        if self.warps > self.total_frames:
+            # Checagem barata: warp repetido indica janela descartando frames ainda em uso
+            print(f"⚠️ {self.img_path}: {self.warps} warps para {self.total_frames} frames")
+        self._src = None
+        self._ring = [None] * self._lookback
+        self._ring_idx = [-1] * self._lookback
+        self._acc = self._tmp = self._out = None
+
+    def _scratch(self):
+        if self._acc is None:
+            shape = (self.target_h, self.target_w, 3)
+            self._acc = np.empty(shape, dtype=np.uint16)
+            self._tmp = np.empty(shape, dtype=np.uint16)
+            self._out = np.empty(shape, dtype=np.uint8)
+        return self._acc, self._tmp, self._out
+
+    def _render(self, frame_idx, out):
+        src = self._source()
+        src_h, src_w = src.shape[:2]
+        target_w, target_h = self.target_w, self.target_h
+
+        t = frame_idx / self.fps
+        progress = t / self.duration
+
+        # Ease-in-out cúbico (suave para narração)
+        if progress < 0.5:
+            smooth = 4 * progress ** 3
+        else:
+            smooth = 1 - pow(-2 * progress + 2, 3) / 2
+
+        current_zoom = self.zoom_start + (self.zoom_end - self.zoom_start) * smooth
+        scale = self._base_scale * current_zoom
+
+        # Tamanho (virtual) da imagem com zoom: nada é redimensionado por inteiro
+        new_w = src_w * scale
+        new_h = src_h * scale
+
+        # Pan mais sutil (não distrai da narração), com precisão de subpixel
+        x_pan = self.pan_strength * math.sin(progress * math.pi) * 0.3
+        y_pan = self.pan_strength * math.cos(progress * math.pi) * 0.15
+
+        x_center = (new_w - target_w) / 2
+        y_center = (new_h - target_h) / 2
+
+        x1 = max(0.0, min(x_center + x_pan, new_w - target_w))
+        y1 = max(0.0, min(y_center + y_pan, new_h - target_h))
+
+        # Um único warp afim (escala + translação) direto para o quadro de saída:
+        # só os pixels visíveis são reamostrados. Os termos 0.5 alinham centros de pixel.
+        matrix = np.array([
+            [scale, 0.0, 0.5 * scale - 0.5 - x1],
+            [0.0, scale, 0.5 * scale - 0.5 - y1],
+        ], dtype=np.float64)
+
+        # Imagem menor que o quadro (ex.: retrato): completa com preto, como o crop do PIL
+        if new_w < target_w or new_h < target_h:
+            border = cv2.BORDER_CONSTANT
+        else:
+            border = cv2.BORDER_REFLECT_101
+
+        cv2.warpAffine(src, matrix, (target_w, target_h), dst=out, flags=cv2.INTER_CUBIC, borderMode=border)
+
+        if self.mask is not None:
+            apply_vignette(out, self.mask, out=out, scratch=self._scratch()[0])
+        return out
+
+    def raw_frame(self, frame_idx):
+        slot = frame_idx % self._lookback
+        if self._ring_idx[slot] == frame_idx:
+            return self._ring[slot]
+
+        # O slot guarda o frame frame_idx - taps, que já saiu da janela
+        if self._ring[slot] is None:
+            self._ring[slot] = np.empty((self.target_h, self.target_w, 3), dtype=np.uint8)
+        self._ring_idx[slot] = -1  # se o render falhar, o slot não fica marcado
+        self._render(frame_idx, self._ring[slot])
+        self._ring_idx[slot] = frame_idx
+        self.warps += 1
+        return self._ring[slot]
+
+    def frame(self, frame_idx):
+        frame_idx = min(max(frame_idx, 0), self.total_frames - 1)
+        if len(self.weights) == 1:
+            return self.raw_frame(frame_idx)
+
+        # Busca a janela inteira antes de somar (o render usa o mesmo acumulador na vinheta),
+        # do frame mais antigo para o atual: os anteriores já estão no anel, então cada frame
+        # de saída custa um único warp, qualquer que seja motion_blur_taps.
+        # No início do clipe os frames anteriores são o frame 0 repetido.
+        taps = len(self.weights)
+        raws = [None] * taps
+        for k in range(taps - 1, -1, -1):
+            raws[k] = self.raw_frame(max(frame_idx - k, 0))
+
+        # Motion blur em ponto fixo: soma ponderada em uint16 (pesos somam 256), sem floats
+        acc, tmp, out = self._scratch()
+        np.multiply(raws[0], self.weights[0], out=acc, dtype=np.uint16)
+        for raw, weight in zip(raws[1:], self.weights[1:]):
+            if weight:
+                np.multiply(raw, weight, out=tmp, dtype=np.uint16)
+                np.add(acc, tmp, out=acc)
+        np.add(acc, 128, out=acc)  # arredonda
+        np.right_shift(acc, 8, out=acc)
+        np.copyto(out, acc, casting="unsafe")
+        return out
+
+    def make_frame(self, t):
+        return self.frame(int(t * self.fps))
+
+
+# FUNÇÃO KENBURNS OTIMIZADA PARA YOUTUBE DARK
+def kenburns_youtube(img_path, duration=4, zoom_start=1.0, zoom_end=1.1,
+                     pan_strength=20, fps=30, vignette=True, color_grade="dark",
+                     vignette_strength=0.5, motion_blur=0.2, motion_blur_taps=2):
+    frames = KenBurnsFrames(
+        img_path,
+        duration=duration,
+        zoom_start=zoom_start,
+        zoom_end=zoom_end,
+        pan_strength=pan_strength,
+        fps=fps,
+        vignette=vignette,
+        color_grade=color_grade,
+        vignette_strength=vignette_strength,
+        blur_amount=motion_blur,
+        blur_taps=motion_blur_taps
+    )
+
+    # O VideoClip lê o frame 0 para descobrir o tamanho; depois disso a imagem
+    # é liberada e só volta a ser carregada quando o encode chegar neste clipe
+    clip = VideoClip(frames.make_frame, duration=duration).set_fps(fps)
+    frames.release()
+    return clip
 
 
 # ========================
-# 🧠 ENDPOINT: /whisper
+# 🎞 TIMELINE (transições só onde há sobreposição)
 # ========================
-@app.post("/whisper")
-async def transcribe_audio(
-    file: UploadFile = File(...),
-    language: str = Form(None),
-    model_name: str = Form("small"),
-    output_format: str = Form("text")
-):
+TRANSITION_SECONDS = 0.5
+
+
+class KenBurnsTimeline:
     """
-    Transcreve áudio com o modelo Whisper. Suporta formatos: text, srt, vtt, json.
+    Sequência de clipes KenBurnsFrames num único make_frame, no lugar de
+    concatenate_videoclips(method="compose"). Fora das janelas de transição o
+    frame do clipe passa direto, sem composição; dentro delas a mistura é feita
+    em ponto fixo com rampas de alfa (0..256) calculadas uma vez.
+
+    transition="fade": cada clipe entra e sai pelo preto, sem sobreposição
+    (o mesmo resultado do crossfadein/crossfadeout + compose).
+    transition="crossfade": clipes vizinhos se sobrepõem por overlap segundos.
     """
-    try:
-        input_path = os.path.join(UPLOAD_DIR, f"{uuid.uuid4()}_{file.filename}")
-        with open(input_path, "wb") as f:
-            f.write(await file.read())
 
-        # Carrega modelo
-        model = whisper.load_model(model_name)
+    def __init__(self, sources, fps, clip_duration, fade=True, transition="fade",
+                 overlap=TRANSITION_SECONDS):
+        self.sources = sources
+        self.fps = fps
+        n = len(sources)
+        clip_frames = max(int(clip_duration * fps), 1)
+        ramp_frames = max(round(overlap * fps), 1)
 
-        kwargs = {}
-        if language:
-            kwargs["language"] = language
+        self.fade = fade and transition != "crossfade"
+        self.crossfade = fade and transition == "crossfade" and n > 1
+        if self.crossfade:
+            ramp_frames = min(ramp_frames, clip_frames - 1)
+            self.crossfade = ramp_frames > 0
 
-        result = model.transcribe(input_path, **kwargs)
+        if self.crossfade:
+            # Em frames inteiros: toda sobreposição tem exatamente ramp_frames frames
+            self.starts = [i * (clip_frames - ramp_frames) for i in range(n)]
+            self.total_frames = self.starts[-1] + clip_frames
+            self.duration = self.total_frames / fps
+        else:
+            self.starts = [round(i * clip_duration * fps) for i in range(n)]
+            self.duration = n * clip_duration
+            self.total_frames = max(int(self.duration * fps), 1)
+        # Último frame de cada clipe (exclusivo): no crossfade invade o início do próximo
+        if self.crossfade:
+            self.ends = [start + clip_frames for start in self.starts]
+        else:
+            self.ends = self.starts[1:] + [self.total_frames]
+        self.ends[-1] = self.total_frames
 
-        # Writer oficial
-        writer = get_writer(output_format, UPLOAD_DIR)
-        writer(result, input_path)
+        # Rampas em ponto fixo, indexadas pela distância (em frames) até a borda
+        self.ramp_frames = ramp_frames
+        if self.crossfade:
+            # Os dois clipes contribuem em todos os frames da sobreposição
+            self.ramp = [round(256 * (k + 1) / (ramp_frames + 1)) for k in range(ramp_frames)]
+        else:
+            self.ramp = [min(round(256 * k / (overlap * fps)), 256) for k in range(ramp_frames + 1)]
 
-        output_path = os.path.splitext(input_path)[0] + f".{output_format}"
-        with open(output_path, "r", encoding="utf-8") as f:
-            content = f.read()
+        self._active = set()
+        self._acc = None
+        self._tmp = None
+        self._out = None
 
-        # Limpeza
-        os.remove(input_path)
-        os.remove(output_path)
+    def release(self):
+        for i in self._active:
+            self.sources[i].release()
+        self._active = set()
+        self._acc = self._tmp = self._out = None
 
-        return JSONResponse({
-            "format": output_format,
-            "language": result.get("language", language or "auto"),
-            "content": content
-        })
+    def _scratch(self):
+        if self._acc is None:
+            shape = (KenBurnsFrames.target_h, KenBurnsFrames.target_w, 3)
+            self._acc = np.empty(shape, dtype=np.uint16)
+            self._tmp = np.empty(shape, dtype=np.uint16)
+            self._out = np.empty(shape, dtype=np.uint8)
+        return self._acc, self._tmp, self._out
 
-    except Exception as e:
-        return JSONResponse({"error": str(e)}, status_code=500)
+    def _activate(self, indices):
+        # Clipes que saíram da janela devolvem imagem e buffers
+        for i in self._active - indices:
+            self.sources[i].release()
+        self._active = indices
+
+    def _fade_weight(self, i, frame_idx):
+        if not self.fade:
+            return 256
+        local = frame_idx - self.starts[i]
+        remaining = self.ends[i] - frame_idx
+        weight = 256
+        if i > 0 and local < self.ramp_frames:
+            weight = self.ramp[local]
+        if i < len(self.sources) - 1 and remaining <= self.ramp_frames:
+            weight = min(weight, self.ramp[remaining])
+        return weight
+
+    def frame(self, frame_idx):
+        frame_idx = min(max(frame_idx, 0), self.total_frames - 1)
+        i = bisect.bisect_right(self.starts, frame_idx) - 1
+
+        if self.crossfade and i > 0 and frame_idx < self.ends[i - 1]:
+            # Janela de sobreposição: anterior * (256 - a) + atual * a
+            self._activate({i - 1, i})
+            alpha = self.ramp[frame_idx - self.starts[i]]
+            previous = self.sources[i - 1].frame(frame_idx - self.starts[i - 1])
+            current = self.sources[i].frame(frame_idx - self.starts[i])
+            acc, tmp, out = self._scratch()
+            np.multiply(previous, 256 - alpha, out=acc, dtype=np.uint16)
+            np.multiply(current, alpha, out=tmp, dtype=np.uint16)
+            np.add(acc, tmp, out=acc)
+        else:
+            self._activate({i})
+            current = self.sources[i].frame(frame_idx - self.starts[i])
+            weight = self._fade_weight(i, frame_idx)
+            if weight == 256:
+                return current  # passthrough: nenhum trabalho extra
+            acc, tmp, out = self._scratch()
+            np.multiply(current, weight, out=acc, dtype=np.uint16)
+
+        np.add(acc, 128, out=acc)  # arredonda
+        np.right_shift(acc, 8, out=acc)
+        np.copyto(out, acc, casting="unsafe")
+        return out
+
+    def make_frame(self, t):
+        # t * fps pode cair logo abaixo do inteiro (ex.: 0.1 * 30)
+        return self.frame(int(t * self.fps + 1e-6))
+
+
+def audio_duration(audio_path):
+    """
+    Duração do áudio pelo media_info (ffprobe em cache; nenhum leitor é aberto).
+    None se o arquivo não tem stream de áudio. Os endpoints passam a duração já
+    lida aos renders (duracao_audio): num worker, fora do processo da API, o
+    sha256 de um áudio fora do store seria recalculado lendo o arquivo inteiro.
+    """
+    info = media_info.get(audio_path)
+    if info["sample_rate"] is None:
+        return None
+    return info["duration"]
+
+
+def render_kenburns_youtube(imagens, audio_path, output_path, zoom_start, zoom_end, pan_strength,
+                            fps_final, delay_start, fade, audio_delay, codec, preset, vignette,
+                            color_grade, vignette_strength=0.5, motion_blur=0.2, motion_blur_taps=2,
+                            transition="fade", duracao_audio=None, progress=None):
+    """
+    Renderiza o vídeo do /ffmpeg_ken_youtube. Roda no pool de render (processo separado).
+    """
+    imagens = [img for img in imagens if os.path.exists(img)]
+    if not imagens:
+        raise RuntimeError("Nenhum clipe válido gerado.")
+
+    if duracao_audio is None:
+        duracao_audio = audio_duration(audio_path)
+    num_imagens = len(imagens)
+    duracao_por_imagem = max(duracao_audio / num_imagens, 0.1)
+    if fade and transition == "crossfade" and num_imagens > 1:
+        # Cada transição sobrepõe dois clipes: estica os clipes para manter a duração total
+        duracao_por_imagem += TRANSITION_SECONDS * (num_imagens - 1) / num_imagens
+
+    # Fontes de frames (nada é carregado até o encode chegar em cada clipe)
+    sources = []
+    for i, img in enumerate(imagens):
+        if progress:
+            progress(0.05 * i / num_imagens, "preparando", imagem=i + 1, imagens=num_imagens)
+        # Alterna zoom
+        if i % 2 == 0:
+            current_zoom_start = zoom_start
+            current_zoom_end = zoom_end
+        else:
+            current_zoom_start = zoom_end
+            current_zoom_end = zoom_start
+
+        sources.append(KenBurnsFrames(
+            img,
+            duration=duracao_por_imagem,
+            zoom_start=current_zoom_start,
+            zoom_end=current_zoom_end,
+            pan_strength=pan_strength,
+            fps=fps_final,
+            vignette=vignette,
+            color_grade=color_grade,
+            vignette_strength=vignette_strength,
+            blur_amount=motion_blur,
+            blur_taps=motion_blur_taps
+        ))
+
+    # Combina: FADE IN/OUT entre clips (suaviza transições) só nas janelas de transição
+    timeline = KenBurnsTimeline(sources, fps_final, duracao_por_imagem, fade=fade, transition=transition)
+    video = VideoClip(timeline.make_frame, duration=timeline.duration).set_fps(fps_final)
+    timeline.release()
+    if delay_start > 0:
+        video = video.set_start(delay_start)
+
+    # Áudio aberto só para o mux
+    audio = AudioFileClip(audio_path)
+    if audio_delay > 0:
+        audio = audio.set_start(audio_delay)
+    safe_duration = duracao_audio - 0.2
+    final = video.set_audio(audio).subclip(0, safe_duration)
+
+    # ENCODE OTIMIZADO PARA YOUTUBE
+    # YouTube recomenda: H.264, 30fps, bitrate alto, audio AAC 192kbps
+    # Os frames são gerados durante o encode (sob demanda)
+    if progress:
+        progress(0.05, "encode")
+    tracker = EncodeProgress(progress, f"ffmpeg_ken_youtube {os.path.basename(output_path)}",
+                             duration=final.duration, fps=fps_final, base=0.05, span=0.95,
+                             output_path=output_path)
+    final.write_videofile(
+        output_path,
+        fps=fps_final,
+        codec=codec,
+        audio_codec="aac",
+        audio_bitrate="192k",  # Qualidade de áudio superior para narração
+        preset=preset,
+        ffmpeg_params=youtube_video_params(codec),
+        threads=16,
+        logger=MoviePyProgressLogger(tracker)
+    )
+
+    audio.close()
+    final.close()
+
+    return {
+        "imagens": num_imagens,
+        "tempo_por_imagem": round(duracao_por_imagem, 2),
+        "duracao_audio": round(duracao_audio, 2),
+        "zoom_start": zoom_start,
+        "zoom_end": zoom_end,
+        "pan_strength": pan_strength,
+        "fps_final": fps_final,
+        "vignette": vignette,
+        "color_grade": color_grade,
+        "motion_blur": motion_blur,
+        "motion_blur_taps": motion_blur_taps,
+        "transition": transition,
+        "backend": "moviepy",
+        "encoder": codec,
+        "preset": preset,
+        "encode": tracker.finish(),
+        "output": output_path
+    }
 
 
 # ========================
-# 🎬 ENDPOINT: /ffmpeg (conversão simples)
+# 🎬 BACKEND FFMPEG (filtergraph nativo, sem frames em Python)
 # ========================
-@app.post("/ffmpeg")
-async def convert_media(
-    file: UploadFile = File(...),
-    output_format: str = Form("mp3")
-):
+# Mesmos parâmetros do render MoviePy, traduzidos para filtros do ffmpeg:
+# zoompan (zoom/pan com easing), curves/eq/colorbalance (grades), vignette,
+# fade/xfade (transições). Tudo roda num único processo ffmpeg.
+ZOOMPAN_OVERSAMPLE = 2  # zoompan arredonda x/y para inteiros; ampliar antes suaviza o movimento
+
+FFMPEG_GRADE_FILTERS = {
+    "dark": ["curves=all='0/0 1/0.8'", "eq=contrast=1.2:saturation=0.9"],
+    "cinematic": [
+        "curves=all='0/0 1/0.95'",
+        "eq=contrast=1.15:saturation=1.1",
+        "colorbalance=gs=0.03:bs=0.03:rh=0.04:gh=0.02",  # sombras teal, highlights orange
+    ],
+    "warm": ["eq=saturation=1.1"],
+    "neutral": ["eq=contrast=1.05"],
+}
+
+
+def ffmpeg_grade_filters(color_grade):
+    # Grades customizadas (.cube) usam o lut1d/lut3d do próprio ffmpeg, conforme a dimensão
+    if color_grade in FFMPEG_GRADE_FILTERS:
+        return FFMPEG_GRADE_FILTERS[color_grade]
+    if grade_signature(color_grade):
+        path = custom_grade_path(color_grade)
+        lut_filter = "lut1d" if parse_cube(path)[1] == 1 else "lut3d"
+        return [f"{lut_filter}=file='{path}'"]
+    return []
+
+
+def _ease_expr(p):
+    # Mesmo ease-in-out cúbico do KenBurnsFrames, como expressão do ffmpeg
+    return f"if(lt({p},0.5),4*pow({p},3),1-pow(-2*{p}+2,3)/2)"
+
+
+def _concat_or_xfade(labels, durations, transition):
     """
-    Converte qualquer arquivo de mídia usando FFmpeg.
-    Exemplo: POST /ffmpeg com 'file=@video.mp4' e 'output_format=wav'
+    Junta os clipes: concat simples ou uma cadeia de xfade (transição sobreposta).
+    Retorna (filtros, rótulo final).
     """
-    try:
-        input_path = os.path.join(UPLOAD_DIR, f"{uuid.uuid4()}_{file.filename}")
-        output_path = f"{os.path.splitext(input_path)[0]}.{output_format}"
+    if transition != "crossfade" or len(labels) == 1:
+        return [f"{''.join(labels)}concat=n={len(labels)}:v=1:a=0[vcat]"], "[vcat]"
 
-        with open(input_path, "wb") as f:
-            f.write(await file.read())
+    filters = []
+    current, elapsed = labels[0], durations[0]
+    for k, label in enumerate(labels[1:], start=1):
+        out = f"[x{k}]"
+        offset = elapsed - TRANSITION_SECONDS
+        filters.append(f"{current}{label}xfade=transition=fade:duration={TRANSITION_SECONDS}:offset={offset:.4f}{out}")
+        current, elapsed = out, offset + durations[k]
+    return filters, current
 
-        cmd = ["ffmpeg", "-y", "-i", input_path, output_path]
-        subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
 
-        os.remove(input_path)
-        return FileResponse(output_path, filename=os.path.basename(output_path))
+def build_kenburns_youtube_ffmpeg(imagens, audio_path, output_path, duracao_audio, zoom_start, zoom_end,
+                                  pan_strength, fps_final, delay_start, fade, audio_delay, codec, preset,
+                                  vignette, color_grade, vignette_strength=0.5, transition="fade",
+                                  motion_blur=0.2, motion_blur_taps=2):
+    """
+    Monta o comando ffmpeg do /ffmpeg_ken_youtube. Retorna (cmd, duração por imagem).
+    """
+    n = len(imagens)
+    crossfade = fade and transition == "crossfade" and n > 1
+    duracao_por_imagem = max(duracao_audio / n, 0.1)
+    if crossfade:
+        # Cada transição sobrepõe dois clipes: estica os clipes para manter a duração total
+        duracao_por_imagem += TRANSITION_SECONDS * (n - 1) / n
 
-    except subprocess.CalledProcessError as e:
-        return JSONResponse({"error": f"Erro FFmpeg: {e.stderr.decode('utf-8')}"}, status_code=500)
-    except Exception as e:
-        return JSONResponse({"error": str(e)}, status_code=500)
+    frames = max(int(duracao_por_imagem * fps_final), 1)
+    clip_seconds = frames / fps_final
+
+    cmd = ["ffmpeg", "-y", "-hide_banner"]
+    for img in imagens:
+        cmd += ["-i", img]
+    cmd += ["-i", audio_path]
+
+    p = f"(on/{frames})"
+    ease = _ease_expr(p)
+    oversample = ZOOMPAN_OVERSAMPLE
+    blur_weights = motion_blur_weights(motion_blur, motion_blur_taps)
+
+    filters, labels = [], []
+    for i, img in enumerate(imagens):
+        # Alterna zoom
+        z0, z1 = (zoom_start, zoom_end) if i % 2 == 0 else (zoom_end, zoom_start)
+        zoom = f"{z0}+({z1 - z0})*{ease}"
+        # Pan no espaço da saída (como no render MoviePy), convertido para a entrada
+        pan_x = f"{pan_strength}*sin({p}*PI)*0.3*{oversample}/zoom"
+        pan_y = f"{pan_strength}*cos({p}*PI)*0.15*{oversample}/zoom"
+
+        chain = [
+            # Altura mínima de 1080 e quadro 16:9 central (imagens estreitas ficam à esquerda, como no crop do PIL)
+            "scale=w='if(lt(ih,1080),trunc(iw*1080/ih/2)*2,iw)':h='max(ih,1080)'",
+            "pad=w='max(iw,1920)':h='max(ih,1080)':x=0:y=0:color=black",
+            "crop=1920:1080",
+            *ffmpeg_grade_filters(color_grade),
+            f"scale={1920 * oversample}:{1080 * oversample}",
+            f"zoompan=z='{zoom}'"
+            f":x='clip((iw-iw/zoom)/2+{pan_x},0,iw-iw/zoom)'"
+            f":y='clip((ih-ih/zoom)/2+{pan_y},0,ih-ih/zoom)'"
+            f":d={frames}:s=1920x1080:fps={fps_final}",
+        ]
+        if vignette and vignette_strength > 0:
+            # vignette do ffmpeg escurece com cos(ângulo·r)^4: casa a intensidade nos cantos
+            angle = math.acos(max(1 - min(vignette_strength, 1.0), 0.0) ** 0.25)
+            chain.append(f"vignette=angle={angle:.4f}")
+        if len(blur_weights) > 1:
+            # Motion blur: tmix lista os pesos do frame mais antigo para o atual
+            chain.append(f"tmix=frames={len(blur_weights)}:weights='{' '.join(map(str, reversed(blur_weights)))}'")
+        if fade and not crossfade:
+            # Mesma transição do MoviePy (crossfadein/out sobre fundo preto)
+            if i > 0:
+                chain.append(f"fade=t=in:st=0:d={TRANSITION_SECONDS}")
+            if i < n - 1:
+                chain.append(f"fade=t=out:st={clip_seconds - TRANSITION_SECONDS:.4f}:d={TRANSITION_SECONDS}")
+        chain += ["setsar=1", "format=yuv420p"]
+        filters.append(f"[{i}:v]{','.join(chain)}[v{i}]")
+        labels.append(f"[v{i}]")
+
+    joined, last = _concat_or_xfade(labels, [clip_seconds] * n, "crossfade" if crossfade else "concat")
+    filters += joined
+    if delay_start > 0:
+        filters.append(f"{last}tpad=start_duration={delay_start}:color=black[vout]")
+        last = "[vout]"
+
+    audio_label = f"{n}:a"
+    if audio_delay > 0:
+        ms = int(audio_delay * 1000)
+        filters.append(f"[{n}:a]adelay={ms}|{ms}[aout]")
+        audio_label = "[aout]"
+
+    safe_duration = duracao_audio - 0.2
+    cmd += [
+        "-filter_complex", ";".join(filters),
+        "-map", last, "-map", audio_label,
+        "-t", f"{safe_duration:.3f}",
+        "-r", str(fps_final),
+        "-c:v", codec, "-preset", preset, *youtube_video_params(codec),
+        "-c:a", "aac", "-b:a", "192k",
+        output_path,
+    ]
+    return cmd, duracao_por_imagem
+
+
+def build_kenburns_ffmpeg(imagens, audio_path, output_path, duracao_audio, fps_final=30, zoom_factor=1.3,
+                         codec="h264_nvenc", preset="p5"):
+    """
+    Monta o comando ffmpeg do /ffmpeg_ken (crop aleatório fixo + fade de 1s). Retorna (cmd, duração por imagem).
+    """
+    n = len(imagens)
+    duracao_por_imagem = max(duracao_audio / n, 0.1)  # evita duração zero
+
+    cmd = ["ffmpeg", "-y", "-hide_banner"]
+    for img in imagens:
+        cmd += ["-loop", "1", "-framerate", str(fps_final), "-t", f"{duracao_por_imagem:.4f}", "-i", img]
+    cmd += ["-i", audio_path]
+
+    filters, labels = [], []
+    for i in range(n):
+        # Mesmo sorteio do kenburns(): zoom e canto do recorte
+        zoom = random.uniform(1.0, zoom_factor)
+        fx = random.uniform(0, zoom - 1)
+        fy = random.uniform(0, zoom - 1)
+        chain = [
+            "scale=-2:1080",
+            f"crop=w=iw/{zoom:.4f}:h=ih/{zoom:.4f}:x='min({fx:.4f}*iw,iw-iw/{zoom:.4f})':y='min({fy:.4f}*ih,ih-ih/{zoom:.4f})'",
+            "scale=1920:1080",
+            "fade=t=in:st=0:d=1",
+            f"fade=t=out:st={max(duracao_por_imagem - 1, 0):.4f}:d=1",
+            "setsar=1",
+            "format=yuv420p",
+        ]
+        filters.append(f"[{i}:v]{','.join(chain)}[v{i}]")
+        labels.append(f"[v{i}]")
+
+    joined, last = _concat_or_xfade(labels, [duracao_por_imagem] * n, "concat")
+    filters += joined
+
+    cmd += [
+        "-filter_complex", ";".join(filters),
+        "-map", last, "-map", f"{n}:a",
+        "-t", f"{duracao_audio:.3f}",
+        "-r", str(fps_final),
+        "-c:v", codec, "-preset", preset, "-pix_fmt", "yuv420p",
+        "-c:a", "aac",
+        output_path,
+    ]
+    return cmd, duracao_por_imagem
+
+
+def run_ffmpeg_render(cmd, tracker=None):
+    """
+    Roda o ffmpeg (bloqueante). Com tracker (EncodeProgress), lê o -progress
+    do stdout e publica frames, fps, velocidade, bitrate e ETA durante o encode.
+    """
+    if tracker is None:
+        try:
+            subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        except subprocess.CalledProcessError as e:
+            raise RuntimeError(f"Erro FFmpeg: {e.stderr.decode('utf-8', errors='replace')[-2000:]}")
+        return None
+
+    cmd = [cmd[0], "-progress", "pipe:1", "-nostats", *cmd[1:]]
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, errors="replace")
+    # stderr em outra thread: se encher o pipe, o ffmpeg trava
+    stderr_tail = deque(maxlen=200)
+    reader = threading.Thread(target=stderr_tail.extend, args=(proc.stderr,), daemon=True)
+    reader.start()
+    parser = FfmpegProgressParser(tracker)
+    for line in proc.stdout:
+        parser.feed(line)
+    proc.wait()
+    reader.join()
+    if proc.returncode != 0:
+        raise RuntimeError(f"Erro FFmpeg: {''.join(stderr_tail)[-2000:]}")
+    return tracker.finish()
+
+
+def render_kenburns_ffmpeg(imagens, audio_path, output_path, codec="h264_nvenc", preset="p5",
+                           duracao_audio=None, progress=None):
+    """
+    /ffmpeg_ken com backend=ffmpeg.
+    """
+    imagens = [img for img in imagens if os.path.exists(img)]
+    if not imagens:
+        raise RuntimeError("Nenhum clipe válido gerado.")
+
+    if duracao_audio is None:
+        duracao_audio = audio_duration(audio_path)
+    cmd, duracao_por_imagem = build_kenburns_ffmpeg(imagens, audio_path, output_path, duracao_audio,
+                                                    codec=codec, preset=preset)
+    if progress:
+        progress(0.0, "ffmpeg")
+    tracker = EncodeProgress(progress, f"ffmpeg_ken {os.path.basename(output_path)}",
+                             duration=duracao_audio, fps=30, stage="ffmpeg")
+    encode = run_ffmpeg_render(cmd, tracker)
+
+    return {
+        "imagens": len(imagens),
+        "tempo_por_imagem": round(duracao_por_imagem, 2),
+        "duracao_audio": round(duracao_audio, 2),
+        "backend": "ffmpeg",
+        "encoder": codec,
+        "preset": preset,
+        "encode": encode,
+        "output": output_path
+    }
+
+
+def render_kenburns_youtube_ffmpeg(imagens, audio_path, output_path, zoom_start, zoom_end, pan_strength,
+                                   fps_final, delay_start, fade, audio_delay, codec, preset, vignette,
+                                   color_grade, vignette_strength=0.5, transition="fade", motion_blur=0.2,
+                                   motion_blur_taps=2, duracao_audio=None, progress=None):
+    """
+    /ffmpeg_ken_youtube com backend=ffmpeg.
+    """
+    imagens = [img for img in imagens if os.path.exists(img)]
+    if not imagens:
+        raise RuntimeError("Nenhum clipe válido gerado.")
+
+    if duracao_audio is None:
+        duracao_audio = audio_duration(audio_path)
+    cmd, duracao_por_imagem = build_kenburns_youtube_ffmpeg(
+        imagens, audio_path, output_path, duracao_audio,
+        zoom_start=zoom_start,
+        zoom_end=zoom_end,
+        pan_strength=pan_strength,
+        fps_final=fps_final,
+        delay_start=delay_start,
+        fade=fade,
+        audio_delay=audio_delay,
+        codec=codec,
+        preset=preset,
+        vignette=vignette,
+        color_grade=color_grade,
+        vignette_strength=vignette_strength,
+        transition=transition,
+        motion_blur=motion_blur,
+        motion_blur_taps=motion_blur_taps
+    )
+    if progress:
+        progress(0.0, "ffmpeg")
+    tracker = EncodeProgress(progress, f"ffmpeg_ken_youtube {os.path.basename(output_path)}",
+                             duration=duracao_audio + delay_start, fps=fps_final, stage="ffmpeg")
+    encode = run_ffmpeg_render(cmd, tracker)
+
+    return {
+        "imagens": len(imagens),
+        "tempo_por_imagem": round(duracao_por_imagem, 2),
+        "duracao_audio": round(duracao_audio, 2),
+        "zoom_start": zoom_start,
+        "zoom_end": zoom_end,
+        "pan_strength": pan_strength,
+        "fps_final": fps_final,
+        "vignette": vignette,
+        "color_grade": color_grade,
+        "motion_blur": motion_blur,
+        "motion_blur_taps": motion_blur_taps,
+        "transition": transition,
+        "backend": "ffmpeg",
+        "encoder": codec,
+        "preset": preset,
+        "encode": encode,
+        "output": output_path
+    }
 
 
 # ========================
-# 📤 ENDPOINT: /upload
+# 🧩 RENDER EM SEGMENTOS PARALELOS (um por imagem + concat sem reencode)
 # ========================
-@app.post("/upload")
-async def upload_file(file: UploadFile = File(...)):
+# Cada imagem vira um segmento de vídeo independente, renderizado num processo
+# do pool "segment" com os mesmos parâmetros de encode; no fim o concat demuxer
+# junta tudo com -c copy e o áudio é muxado uma única vez.
+class SegmentCache:
     """
-    Salva um arquivo em /workspace/uploads/
+    Cache em disco de segmentos já codificados, endereçado por uma chave que
+    combina o conteúdo da imagem e todos os parâmetros que afetam os frames e o
+    encode. Despejo LRU (pela data de acesso) quando passa da cota.
     """
+
+    # Mude quando o render dos frames mudar: invalida os segmentos antigos
+    VERSION = 2  # 2: motion blur em ponto fixo
+
+    def __init__(self, root, quota_bytes):
+        self.root = root
+        self.quota_bytes = quota_bytes
+        os.makedirs(root, exist_ok=True)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, **params):
+        payload = json.dumps({"version": self.VERSION, **params}, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.root, key[:2], f"{key}.mp4")
+
+    def fetch(self, key, dest_path):
+        """
+        Copia (hardlink quando possível) o segmento para dest_path. True se achou.
+        """
+        path = self._path(key)
+        with self._lock:
+            if not os.path.exists(path):
+                self.misses += 1
+                return False
+            os.utime(path)  # marca uso recente (LRU)
+            _link_or_copy(path, dest_path)
+            self.hits += 1
+            return True
+
+    def store(self, key, src_path):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        _link_or_copy(src_path, tmp_path)
+        os.replace(tmp_path, path)
+        self._evict()
+
+    def _evict(self):
+        with self._lock:
+            evict_lru(self.root, self.quota_bytes, suffix=".mp4")
+
+
+def _link_or_copy(src, dst):
     try:
-        filename = f"{uuid.uuid4()}_{file.filename}"
-        filepath = os.path.join(UPLOAD_DIR, filename)
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
 
-        with open(filepath, "wb") as f:
-            f.write(await file.read())
 
-        return JSONResponse({
-            "status": "success",
-            "filename": file.filename,
-            "saved_as": filename,
-            "path": filepath
-        })
+segment_cache = SegmentCache(os.path.join(CACHE_DIR, "segments"), SEGMENT_CACHE_MB * 2**20)
 
-    except Exception as e:
-        return JSONResponse({"status": "error", "message": str(e)}, status_code=500)
 
+def segment_frames(duration, fps):
+    # Segmentos com número inteiro de frames: os cortes caem exatamente na grade de tempo
+    return max(round(duration * fps), 1)
 
-# ========================
-# 🎞 ENDPOINT: /ffmpeg_ken (MoviePy + NVENC)
-# ========================
-def kenburns(img_path, duration=4, zoom_factor=1.3):
+
+def render_kenburns_segment(segment_path, img_path, duration, fps, codec, preset, ffmpeg_params):
     """
-    Aplica efeito Ken Burns (zoom/pan suave) com duração garantida.
+    Um segmento do /ffmpeg_ken (sem áudio). Roda no pool "segment".
     """
-    clip = ImageClip(img_path).resize(height=1080).set_duration(duration)
-    w, h = clip.size
+    clip = kenburns(img_path, duration=duration).set_fps(fps)
+    clip.write_videofile(
+        segment_path, fps=fps, codec=codec, preset=preset, audio=False,
+        ffmpeg_params=ffmpeg_params, threads=2, logger=None
+    )
+    clip.close()
+    return segment_path
 
-    zoom = random.uniform(1.0, zoom_factor)
-    start_x = random.uniform(0, w * (zoom - 1))
-    start_y = random.uniform(0, h * (zoom - 1))
 
-    return (
-        clip.crop(x1=start_x, y1=start_y, x2=start_x + w / zoom, y2=start_y + h / zoom)
-        .resize((1920, 1080))
-        .fadein(1)
-        .fadeout(1)
+def render_kenburns_youtube_segment(segment_path, img_path, duration, fps, zoom_start, zoom_end, pan_strength,
+                                    vignette, vignette_strength, color_grade, fade_in, fade_out, codec, preset,
+                                    ffmpeg_params, motion_blur=0.2, motion_blur_taps=2):
+    """
+    Um segmento do /ffmpeg_ken_youtube (sem áudio). Roda no pool "segment".
+    """
+    clip = kenburns_youtube(
+        img_path,
+        duration=duration,
+        zoom_start=zoom_start,
+        zoom_end=zoom_end,
+        pan_strength=pan_strength,
+        fps=fps,
+        vignette=vignette,
+        color_grade=color_grade,
+        vignette_strength=vignette_strength,
+        motion_blur=motion_blur,
+        motion_blur_taps=motion_blur_taps
     )
+    # Sozinho, o crossfade sobre fundo preto do MoviePy equivale a um fade simples
+    if fade_in:
+        clip = clip.fadein(TRANSITION_SECONDS)
+    if fade_out:
+        clip = clip.fadeout(TRANSITION_SECONDS)
+    clip.write_videofile(
+        segment_path, fps=fps, codec=codec, preset=preset, audio=False,
+        ffmpeg_params=ffmpeg_params, threads=2, logger=None
+    )
+    clip.close()
+    return segment_path
 
-@app.post("/ffmpeg_ken")
-async def gerar_video_kenburns(
-    audio_file: str = Form(...),
-    image_pattern: str = Form(...),
-    output_name: str = Form("video_final.mp4")
-):
+
+def render_segments(segment_fn, segments, audio_path, output_path, duration, audio_args=(),
+                    delay_start=0.0, audio_delay=0.0, cache_keys=None, progress=None):
     """
-    Gera vídeo com Ken Burns real (zoom/pan em cada imagem),
-    sincronizado com o áudio e renderizado em GPU (NVENC).
+    Renderiza os segmentos em paralelo e junta com o concat demuxer (stream copy).
+    segments: lista de kwargs para segment_fn (sem segment_path).
+    cache_keys: chaves do segment_cache (uma por segmento); acertos pulam o render.
+    Retorna o número de segmentos reaproveitados do cache.
     """
+    work_dir = os.path.join(OUTPUT_DIR, ".segments", uuid.uuid4().hex)
+    os.makedirs(work_dir, exist_ok=True)
     try:
-        audio_path = os.path.join(UPLOAD_DIR, audio_file)
-        imagens_glob = os.path.join(UPLOAD_DIR, "imagens", image_pattern)
-        output_path = os.path.join(OUTPUT_DIR, output_name)
-        os.makedirs(OUTPUT_DIR, exist_ok=True)
+        paths = [os.path.join(work_dir, f"seg_{k:05d}.mp4") for k in range(len(segments))]
+        keys = cache_keys or [None] * len(segments)
 
-        imagens = sorted(glob.glob(imagens_glob))
-        if not imagens:
-            return JSONResponse({"error": f"Nenhuma imagem encontrada em {imagens_glob}"}, status_code=400)
+        futures = {}
+        for path, kwargs, key in zip(paths, segments, keys):
+            if key and segment_cache.fetch(key, path):
+                continue
+            pool, future = submit_to_pool("segment", segment_fn, path, **kwargs)
+            futures[future] = (path, key)
+        cached = len(segments) - len(futures)
 
-        # Garante que o áudio foi carregado corretamente
-        if not os.path.exists(audio_path):
-            return JSONResponse({"error": f"Arquivo de áudio não encontrado: {audio_path}"}, status_code=400)
+        inicio = time.perf_counter()
+        try:
+            for done, future in enumerate(as_completed(futures), start=cached + 1):
+                future.result()
+                path, key = futures[future]
+                if key:
+                    segment_cache.store(key, path)
+                # Throughput medido nos segmentos renderizados (os do cache não contam)
+                elapsed = time.perf_counter() - inicio
+                rate = (done - cached) / elapsed if elapsed > 0 else 0.0
+                eta = round((len(segments) - done) / rate, 1) if rate > 0 else None
+                print(f"[segmentos] {done}/{len(segments)} ({rate:.2f}/s, eta={eta}s)")
+                if progress:
+                    progress(0.95 * done / len(segments), "segmentos", segmentos=done, total=len(segments),
+                             segmentos_por_segundo=round(rate, 3), eta_seconds=eta)
+        except BaseException as e:
+            for future in futures:
+                future.cancel()
+            if isinstance(e, BrokenProcessPool):
+                discard_pool("segment", pool)
+            raise
+
+        list_path = os.path.join(work_dir, "concat.txt")
+        with open(list_path, "w", encoding="utf-8") as f:
+            for path in paths:
+                escaped = path.replace("'", "'\\''")
+                f.write(f"file '{escaped}'\n")
+
+        if progress:
+            progress(0.95, "concat")
+        cmd = ["ffmpeg", "-y", "-hide_banner"]
+        if delay_start > 0:
+            cmd += ["-itsoffset", str(delay_start)]
+        cmd += ["-f", "concat", "-safe", "0", "-i", list_path, "-i", audio_path,
+                "-map", "0:v", "-map", "1:a", "-c:v", "copy"]
+        if audio_delay > 0:
+            ms = int(audio_delay * 1000)
+            cmd += ["-af", f"adelay={ms}|{ms}"]
+        cmd += ["-c:a", "aac", *audio_args, "-t", f"{duration:.3f}", "-movflags", "+faststart", output_path]
+        tracker = EncodeProgress(progress, f"concat {os.path.basename(output_path)}", duration=duration,
+                                 stage="concat", base=0.95, span=0.05)
+        run_ffmpeg_render(cmd, tracker)
+        return cached
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def render_kenburns_segmented(imagens, audio_path, output_path, codec="h264_nvenc", preset="p5",
+                              duracao_audio=None, progress=None):
+    """
+    /ffmpeg_ken com parallel=true. Roda no pool "ffmpeg" (só orquestra).
+    """
+    imagens = [img for img in imagens if os.path.exists(img)]
+    if not imagens:
+        raise RuntimeError("Nenhum clipe válido gerado.")
 
-        audio = AudioFileClip(audio_path)
-        num_imagens = len(imagens)
-        duracao_por_imagem = max(audio.duration / num_imagens, 0.1)  # evita duração zero
+    fps_final = 30
+    if duracao_audio is None:
+        duracao_audio = audio_duration(audio_path)
+    duracao_por_imagem = max(duracao_audio / len(imagens), 0.1)  # evita duração zero
+    seg_duration = segment_frames(duracao_por_imagem, fps_final) / fps_final
 
-        clips = [kenburns(img, duration=duracao_por_imagem) for img in imagens if os.path.exists(img)]
-        if not clips:
-            return JSONResponse({"error": "Nenhum clipe válido gerado."}, status_code=500)
+    segments = [
+        dict(img_path=img, duration=seg_duration, fps=fps_final, codec=codec, preset=preset,
+             ffmpeg_params=["-pix_fmt", "yuv420p"])
+        for img in imagens
+    ]
+    render_segments(render_kenburns_segment, segments, audio_path, output_path, duracao_audio, progress=progress)
+
+    return {
+        "imagens": len(imagens),
+        "tempo_por_imagem": round(duracao_por_imagem, 2),
+        "duracao_audio": round(duracao_audio, 2),
+        "backend": "moviepy",
+        "parallel": True,
+        "encoder": codec,
+        "preset": preset,
+        "output": output_path
+    }
 
-        # Define FPS fixo para todo o vídeo
-        fps_final = 30
 
-        video = concatenate_videoclips(clips, method="compose").set_duration(audio.duration).set_fps(fps_final)
+def render_kenburns_youtube_segmented(imagens, audio_path, output_path, zoom_start, zoom_end, pan_strength,
+                                      fps_final, delay_start, fade, audio_delay, codec, preset, vignette,
+                                      color_grade, vignette_strength=0.5, motion_blur=0.2, motion_blur_taps=2,
+                                      use_cache=True, duracao_audio=None, progress=None):
+    """
+    /ffmpeg_ken_youtube com parallel=true. Roda no pool "ffmpeg" (só orquestra).
+    """
+    imagens = [img for img in imagens if os.path.exists(img)]
+    if not imagens:
+        raise RuntimeError("Nenhum clipe válido gerado.")
 
-        final = video.set_audio(audio)
+    if duracao_audio is None:
+        duracao_audio = audio_duration(audio_path)
+    n = len(imagens)
+    duracao_por_imagem = max(duracao_audio / n, 0.1)
+    seg_duration = segment_frames(duracao_por_imagem, fps_final) / fps_final
 
-        final.write_videofile(
-            output_path,
-            fps=fps_final,                   # 👈 FPS explícito (corrige o erro)
-            codec="h264_nvenc",              # GPU
-            audio_codec="aac",
-            preset="p5",
-            ffmpeg_params=["-pix_fmt", "yuv420p"],
-            threads=2,
-            logger=None
+    segments, keys = [], []
+    for i, img in enumerate(imagens):
+        # Alterna zoom
+        z0, z1 = (zoom_start, zoom_end) if i % 2 == 0 else (zoom_end, zoom_start)
+        segment = dict(
+            img_path=img,
+            duration=seg_duration,
+            fps=fps_final,
+            zoom_start=z0,
+            zoom_end=z1,
+            pan_strength=pan_strength,
+            vignette=vignette,
+            vignette_strength=vignette_strength,
+            color_grade=color_grade,
+            motion_blur=motion_blur,
+            motion_blur_taps=motion_blur_taps,
+            fade_in=fade and i > 0,
+            fade_out=fade and i < n - 1,
+            codec=codec,
+            preset=preset,
+            ffmpeg_params=youtube_video_params(codec)
         )
+        segments.append(segment)
+        if use_cache:
+            # Mesma imagem + mesmos parâmetros = mesmo segmento codificado
+            params = {k: v for k, v in segment.items() if k != "img_path"}
+            keys.append(segment_cache.key(image=file_sha256(img), grade=grade_signature(color_grade), **params))
 
-        return JSONResponse({
-            "message": "✅ Vídeo gerado com sucesso (Ken Burns real)!",
-            "imagens": num_imagens,
-            "tempo_por_imagem": round(duracao_por_imagem, 2),
-            "duracao_audio": round(audio.duration, 2),
-            "output": output_path
-        })
+    cached = render_segments(
+        render_kenburns_youtube_segment, segments, audio_path, output_path, duracao_audio - 0.2,
+        audio_args=["-b:a", "192k"], delay_start=delay_start, audio_delay=audio_delay,
+        cache_keys=keys if use_cache else None, progress=progress
+    )
+
+    return {
+        "imagens": n,
+        "tempo_por_imagem": round(duracao_por_imagem, 2),
+        "duracao_audio": round(duracao_audio, 2),
+        "zoom_start": zoom_start,
+        "zoom_end": zoom_end,
+        "pan_strength": pan_strength,
+        "fps_final": fps_final,
+        "vignette": vignette,
+        "color_grade": color_grade,
+        "motion_blur": motion_blur,
+        "motion_blur_taps": motion_blur_taps,
+        "backend": "moviepy",
+        "parallel": True,
+        "encoder": codec,
+        "preset": preset,
+        "segmentos_cache": cached,
+        "output": output_path
+    }
 
-    except Exception as e:
-        return JSONResponse({"error": str(e)}, status_code=500)
 
 @app.post("/ffmpeg_ken_youtube")
 async def gerar_video_kenburns_youtube(
     audio_file: str = Form(...),
-    image_pattern: str = Form(...),
+    image_pattern: str = Form(None),
+    image_hashes: str = Form(None),  # alternativa ao pattern: hashes/nomes do store, em ordem
     output_name: str = Form("video_youtube.mp4"),
     zoom_start: float = Form(1.0),
     zoom_end: float = Form(1.08),  # Zoom mais sutil para narração
@@ -224,280 +3925,222 @@ async def gerar_video_kenburns_youtube(
     delay_start: float = Form(0.0),
     fade: bool = Form(True),
     audio_delay: float = Form(0.0),
-    codec: str = Form("h264_nvenc"),
-    preset: str = Form("p6"),  # P6 para qualidade YouTube
+    codec: str = Form("h264_nvenc"),  # sem GPU, cai para o libx264 (ver /encoders)
+    preset: str = Form("p6"),  # P6 para qualidade YouTube (medium no libx264)
     vignette: bool = Form(True),  # Efeito dark nas bordas
-    color_grade: str = Form("dark")  # "dark", "neutral", "warm"
+    vignette_strength: float = Form(0.5),  # 0 = sem vinheta, 1 = cantos pretos
+    color_grade: str = Form("dark"),  # "dark", "neutral", "warm"... (desconhecida, ex. "none" = sem grade)
+    motion_blur: float = Form(0.2),  # peso dos frames anteriores (0 = sem motion blur)
+    motion_blur_taps: int = Form(2),  # frames misturados (atual + anteriores)
+    backend: str = Form("moviepy"),  # "moviepy" ou "ffmpeg" (filtergraph nativo)
+    transition: str = Form("fade"),  # "fade" (via preto) ou "crossfade" (sobreposta, não combina com parallel)
+    parallel: bool = Form(False),  # True: um segmento por imagem em paralelo (backend moviepy)
+    use_cache: bool = Form(True),  # só com parallel=true: reaproveita segmentos já codificados
+    async_job: bool = Form(False),  # True: responde 202 com job_id (ver /jobs)
+    priority: int = Form(0)  # maior = sai antes da fila
 ):
     try:
+        if not image_pattern and not image_hashes:
+            return JSONResponse({"error": "Informe image_pattern ou image_hashes"}, status_code=400)
+
         # Caminhos
-        audio_path = os.path.join(UPLOAD_DIR, audio_file)
-        imagens_glob = os.path.join(UPLOAD_DIR, "imagens", image_pattern)
+        audio_path = resolve_upload(audio_file)
         output_path = os.path.join(OUTPUT_DIR, output_name)
         os.makedirs(OUTPUT_DIR, exist_ok=True)
 
         # Validação de imagens
-        imagens = sorted(glob.glob(imagens_glob))
+        imagens, missing = resolve_images(image_pattern, image_hashes)
+        if missing:
+            return JSONResponse({"error": f"Imagens não encontradas no store: {missing}"}, status_code=400)
         if not imagens:
-            return JSONResponse({"error": f"Nenhuma imagem encontrada: {imagens_glob}"}, status_code=400)
+            return JSONResponse({"error": f"Nenhuma imagem encontrada: {image_pattern}"}, status_code=400)
+
+        if backend not in ("moviepy", "ffmpeg"):
+            return JSONResponse({"error": f"Backend inválido: {backend}"}, status_code=400)
+        if transition not in ("fade", "crossfade"):
+            return JSONResponse({"error": f"Transição inválida: {transition}"}, status_code=400)
+        if transition == "crossfade" and parallel and backend != "ffmpeg":
+            # Segmentos independentes não se sobrepõem
+            return JSONResponse({"error": "transition=crossfade não combina com parallel=true"}, status_code=400)
+        if not 0 <= motion_blur <= 1:
+            return JSONResponse({"error": "motion_blur deve estar entre 0 e 1"}, status_code=400)
+        if not 1 <= motion_blur_taps <= MAX_MOTION_BLUR_TAPS:
+            return JSONResponse({"error": f"motion_blur_taps deve estar entre 1 e {MAX_MOTION_BLUR_TAPS}"}, status_code=400)
+        try:
+            encoder = resolve_encoder(codec, preset)
+        except ValueError as e:
+            return JSONResponse({"error": str(e)}, status_code=400)
+        log_encoder_fallback(encoder)
 
         # Validação de áudio
         if not os.path.exists(audio_path):
             return JSONResponse({"error": f"Arquivo de áudio não encontrado: {audio_path}"}, status_code=400)
 
-        # Tenta carregar o áudio com validação
+        # Valida o áudio pelo ffprobe em cache (fora do event loop)
         try:
-            audio = AudioFileClip(audio_path)
-            if audio is None or audio.duration is None or audio.duration <= 0:
+            duracao_audio = await run_in_pool("ffmpeg", audio_duration, audio_path)
+            if duracao_audio is None or duracao_audio <= 0:
                 return JSONResponse({"error": f"Arquivo de áudio inválido ou corrompido: {audio_path}"}, status_code=400)
         except Exception as e:
             return JSONResponse({"error": f"Erro ao carregar áudio: {str(e)}"}, status_code=400)
 
-        if audio_delay > 0:
-            audio = audio.set_start(audio_delay)
-
-        num_imagens = len(imagens)
-        duracao_por_imagem = max(audio.duration / num_imagens, 0.1)
-
-        # FUNÇÃO KENBURNS OTIMIZADA PARA YOUTUBE DARK
-        def kenburns_youtube(img_path, duration=4, zoom_start=1.0, zoom_end=1.1, 
-                            pan_strength=20, fps=30, vignette=True, color_grade="dark"):
-            import math
-            from moviepy.editor import VideoClip
-            from PIL import Image, ImageEnhance, ImageFilter
-            import numpy as np
-            
-            # Pré-carrega e redimensiona a imagem
-            pil_img = Image.open(img_path).convert('RGB')
-            w, h = pil_img.size
-            
-            if h < 1080:
-                scale = 1080 / h
-                new_size = (int(w * scale), 1080)
-                pil_img = pil_img.resize(new_size, Image.BICUBIC)
-                w, h = pil_img.size
-            
-            # APLICAR COLOR GRADING
-            if color_grade == "dark":
-                # Reduz brilho e aumenta contraste para estética dark
-                enhancer = ImageEnhance.Brightness(pil_img)
-                pil_img = enhancer.enhance(0.8)  # 20% mais escuro
-                
-                enhancer = ImageEnhance.Contrast(pil_img)
-                pil_img = enhancer.enhance(1.2)  # 20% mais contraste
-                
-                enhancer = ImageEnhance.Color(pil_img)
-                pil_img = enhancer.enhance(0.9)  # Saturação levemente reduzida
-            
-            elif color_grade == "cinematic":
-                # Estilo cinema - Teal & Orange (estilo Hollywood/Netflix)
-                enhancer = ImageEnhance.Brightness(pil_img)
-                pil_img = enhancer.enhance(0.95)
-                
-                enhancer = ImageEnhance.Contrast(pil_img)
-                pil_img = enhancer.enhance(1.15)
-                
-                enhancer = ImageEnhance.Color(pil_img)
-                pil_img = enhancer.enhance(1.1)
-                
-                # Aplica teal & orange
-                img_array = np.array(pil_img)
-                brightness = np.mean(img_array, axis=2)
-                
-                # Sombras -> teal (cyan)
-                shadows = brightness < 85
-                img_array[shadows, 1] = np.clip(img_array[shadows, 1] * 1.08, 0, 255)  # +verde
-                img_array[shadows, 2] = np.clip(img_array[shadows, 2] * 1.08, 0, 255)  # +azul
-                
-                # Highlights -> orange
-                highlights = brightness > 170
-                img_array[highlights, 0] = np.clip(img_array[highlights, 0] * 1.1, 0, 255)  # +vermelho
-                img_array[highlights, 1] = np.clip(img_array[highlights, 1] * 1.05, 0, 255)  # +verde
-                
-                pil_img = Image.fromarray(img_array.astype('uint8'))
-            
-            elif color_grade == "warm":
-                # Tom quente sutil
-                enhancer = ImageEnhance.Color(pil_img)
-                pil_img = enhancer.enhance(1.1)
-            
-            elif color_grade == "neutral":
-                # Padrão - apenas leve ajuste de contraste
-                enhancer = ImageEnhance.Contrast(pil_img)
-                pil_img = enhancer.enhance(1.05)
-            
-            target_w, target_h = 1920, 1080
-            
-            # Cache de frames
-            total_frames = int(duration * fps)
-            cached_frames = []
-            
-            print(f"Renderizando {total_frames} frames (YouTube Dark) para {img_path}...")
-            
-            for frame_idx in range(total_frames):
-                t = frame_idx / fps
-                progress = t / duration
-                
-                # Ease-in-out cúbico (suave para narração)
-                if progress < 0.5:
-                    smooth = 4 * progress ** 3
-                else:
-                    smooth = 1 - pow(-2 * progress + 2, 3) / 2
-                
-                current_zoom = zoom_start + (zoom_end - zoom_start) * smooth
-                
-                new_w = math.ceil(w * current_zoom)
-                new_h = math.ceil(h * current_zoom)
-                new_w = new_w + (new_w % 2)
-                new_h = new_h + (new_h % 2)
-                
-                img_zoomed = pil_img.resize((new_w, new_h), Image.BICUBIC)
-                
-                # Pan mais sutil (não distrai da narração)
-                x_pan = int(pan_strength * math.sin(progress * math.pi) * 0.3)
-                y_pan = int(pan_strength * math.cos(progress * math.pi) * 0.15)
-                
-                x_center = (new_w - target_w) // 2
-                y_center = (new_h - target_h) // 2
-                
-                x1 = max(0, min(x_center + x_pan, new_w - target_w))
-                y1 = max(0, min(y_center + y_pan, new_h - target_h))
-                
-                img_cropped = img_zoomed.crop((x1, y1, x1 + target_w, y1 + target_h))
-                
-                # VIGNETTE EFFECT (bordas escuras - estilo dark)
-                if vignette:
-                    # Cria máscara radial
-                    mask = Image.new('L', (target_w, target_h), 0)
-                    from PIL import ImageDraw
-                    draw = ImageDraw.Draw(mask)
-                    
-                    # Gradiente radial simulado
-                    center_x, center_y = target_w // 2, target_h // 2
-                    max_radius = math.sqrt(center_x**2 + center_y**2)
-                    
-                    for y in range(0, target_h, 10):
-                        for x in range(0, target_w, 10):
-                            dist = math.sqrt((x - center_x)**2 + (y - center_y)**2)
-                            brightness = int(255 * (1 - (dist / max_radius) * 0.5))
-                            draw.ellipse([x-5, y-5, x+5, y+5], fill=brightness)
-                    
-                    mask = mask.filter(ImageFilter.GaussianBlur(radius=100))
-                    
-                    # Aplica vignette
-                    dark_layer = Image.new('RGB', (target_w, target_h), (0, 0, 0))
-                    img_cropped = Image.composite(img_cropped, dark_layer, mask)
-                
-                cached_frames.append(np.array(img_cropped))
-            
-            pil_img.close()
-            
-            # Motion blur leve
-            def add_motion_blur(frames, blur_amount=0.2):
-                blurred = []
-                for i in range(len(frames)):
-                    if i == 0:
-                        blurred.append(frames[i])
-                    else:
-                        blended = (frames[i] * (1 - blur_amount) + frames[i-1] * blur_amount).astype(np.uint8)
-                        blurred.append(blended)
-                return blurred
-            
-            cached_frames = add_motion_blur(cached_frames)
-            
-            def make_frame(t):
-                frame_idx = min(int(t * fps), len(cached_frames) - 1)
-                return cached_frames[frame_idx]
-            
-            return VideoClip(make_frame, duration=duration).set_fps(fps)
-
-        # Cria clipes
-        clips = []
-        for i, img in enumerate(imagens):
-            if os.path.exists(img):
-                # Alterna zoom
-                if i % 2 == 0:
-                    current_zoom_start = zoom_start
-                    current_zoom_end = zoom_end
-                else:
-                    current_zoom_start = zoom_end
-                    current_zoom_end = zoom_start
-                    
-                clip = kenburns_youtube(
-                    img,
-                    duration=duracao_por_imagem,
-                    zoom_start=current_zoom_start,
-                    zoom_end=current_zoom_end,
-                    pan_strength=pan_strength,
-                    fps=fps_final,
-                    vignette=vignette,
-                    color_grade=color_grade
-                )
-                
-                # FADE IN/OUT entre clips (suaviza transições)
-                if fade and i > 0:
-                    clip = clip.crossfadein(0.5)
-                if fade and i < len(imagens) - 1:
-                    clip = clip.crossfadeout(0.5)
-                
-                clips.append(clip)
-
-        if not clips:
-            return JSONResponse({"error": "Nenhum clipe válido gerado."}, status_code=500)
-
-        # Combina
-        video = concatenate_videoclips(clips, method="compose").set_fps(fps_final)
-        if delay_start > 0:
-            video = video.set_start(delay_start)
-
-        safe_duration = audio.duration - 0.2
-        final = video.set_audio(audio).subclip(0, safe_duration)
+        kwargs = dict(
+            imagens=imagens,
+            audio_path=audio_path,
+            output_path=output_path,
+            zoom_start=zoom_start,
+            zoom_end=zoom_end,
+            pan_strength=pan_strength,
+            fps_final=fps_final,
+            delay_start=delay_start,
+            fade=fade,
+            audio_delay=audio_delay,
+            codec=encoder["codec"],
+            preset=encoder["preset"],
+            vignette=vignette,
+            vignette_strength=vignette_strength,
+            color_grade=color_grade,
+            motion_blur=motion_blur,
+            motion_blur_taps=motion_blur_taps,
+            duracao_audio=duracao_audio
+        )
+        if backend == "ffmpeg":
+            render_fn, pool = render_kenburns_youtube_ffmpeg, "render"
+            kwargs["transition"] = transition
+        elif parallel:
+            # O orquestrador só espera os segmentos: roda numa thread
+            render_fn, pool = render_kenburns_youtube_segmented, "ffmpeg"
+            kwargs["use_cache"] = use_cache
+        else:
+            render_fn, pool = render_kenburns_youtube, "render"
+            kwargs["transition"] = transition
 
-        # ENCODE OTIMIZADO PARA YOUTUBE
-        # YouTube recomenda: H.264, 30fps, bitrate alto, audio AAC 192kbps
-        final.write_videofile(
-            output_path,
-            fps=fps_final,
-            codec=codec,
-            audio_codec="aac",
-            audio_bitrate="192k",  # Qualidade de áudio superior para narração
-            preset=preset,
-            ffmpeg_params=[
-                "-pix_fmt", "yuv420p",
-                "-gpu", "0",
-                "-rc", "vbr",
-                "-cq", "19",  # YouTube comprime, então qualidade alta
-                "-b:v", "8M",  # 8Mbps ideal para 1080p no YouTube
-                "-maxrate", "12M",
-                "-bufsize", "16M",
-                "-profile:v", "high",  # Profile alto para melhor qualidade
-                "-level", "4.2",
-            ],
-            threads=16,
-            logger=None
+        return await run_render_job(
+            "ffmpeg_ken_youtube", render_fn, kwargs, priority, async_job,
+            "✅ Vídeo YouTube gerado com sucesso!",
+            pool=pool
         )
+
+    except Exception as e:
+        return JSONResponse({"error": str(e)}, status_code=500)
+
         
-        audio.close()
-        final.close()
+# ========================
+# 🎨 ENDPOINTS: /color_grades
+# ========================
+@app.get("/color_grades")
+def list_color_grades():
+    """
+    Grades disponíveis para color_grade: embutidas e customizadas (.cube).
+    """
+    custom = sorted(os.path.splitext(name)[0] for name in os.listdir(LUT_DIR) if name.endswith(".cube"))
+    return {"builtin": sorted(BUILTIN_GRADES), "custom": custom}
 
-        return JSONResponse({
-            "message": "✅ Vídeo YouTube gerado com sucesso!",
-            "imagens": num_imagens,
-            "tempo_por_imagem": round(duracao_por_imagem, 2),
-            "duracao_audio": round(audio.duration, 2),
-            "zoom_start": zoom_start,
-            "zoom_end": zoom_end,
-            "pan_strength": pan_strength,
-            "fps_final": fps_final,
-            "vignette": vignette,
-            "color_grade": color_grade,
-            "output": output_path
-        })
 
+@app.post("/color_grades")
+async def register_color_grade(
+    name: str = Form(...),
+    file: UploadFile = File(...)
+):
+    """
+    Registra uma grade customizada a partir de um arquivo .cube (LUT 1D ou 3D).
+    Depois é só usar color_grade=<name> no /ffmpeg_ken_youtube.
+    """
+    try:
+        if not re.fullmatch(r"[A-Za-z0-9_-]+", name) or name in BUILTIN_GRADES:
+            return JSONResponse({"error": f"Nome inválido: {name}"}, status_code=400)
+
+        tmp_path = os.path.join(LUT_DIR, f".{uuid.uuid4().hex}.cube")
+        await save_upload(file, tmp_path, max_bytes=64 * 2**20)
+        try:
+            size, dims, _, _ = await run_in_pool("ffmpeg", parse_cube, tmp_path)
+        except ValueError as e:
+            os.remove(tmp_path)
+            return JSONResponse({"error": f"Arquivo .cube inválido: {e}"}, status_code=400)
+        os.replace(tmp_path, custom_grade_path(name))
+
+        return {"status": "success", "name": name, "lut_size": size, "dimensions": dims}
+
+    except UploadTooLarge as e:
+        return JSONResponse({"error": str(e)}, status_code=413)
     except Exception as e:
         return JSONResponse({"error": str(e)}, status_code=500)
 
-        
+
+# ========================
+# 📋 ENDPOINTS: /jobs
+# ========================
+# async def: rodam no event loop, o mesmo que altera o render_scheduler
+# (jobs, fila e os asyncio.Event de job.done não são thread-safe)
+def _job_or_404(job_id):
+    job = render_scheduler.jobs.get(job_id)
+    if job is None:
+        return None, JSONResponse({"error": f"Job não encontrado: {job_id}"}, status_code=404)
+    return job, None
+
+
+@app.get("/jobs")
+async def list_jobs():
+    """
+    Lista os jobs (renders na fila, rodando e os últimos finalizados, e conversões do /ffmpeg).
+    """
+    return {
+        "max_concurrent": render_scheduler.max_concurrent,
+        "jobs": [
+            {"job_id": j.id, "kind": j.kind, "status": j.status, "priority": j.priority}
+            for j in render_scheduler.jobs.values()
+        ]
+    }
+
+
+@app.get("/jobs/{job_id}")
+async def job_status(job_id: str):
+    job, error = _job_or_404(job_id)
+    if error:
+        return error
+    return {**job.to_dict(), "queue_position": render_scheduler.queue_position(job)}
+
+
+@app.get("/jobs/{job_id}/progress")
+async def job_progress(job_id: str):
+    job, error = _job_or_404(job_id)
+    if error:
+        return error
+    return {"job_id": job.id, "status": job.status, **job.progress()}
+
+
+@app.get("/jobs/{job_id}/result")
+async def job_result(job_id: str):
+    """
+    Baixa o vídeo gerado (409 enquanto o job não terminou).
+    """
+    job, error = _job_or_404(job_id)
+    if error:
+        return error
+    if job.status in ("queued", "running"):
+        return JSONResponse({"job_id": job.id, "status": job.status}, status_code=409)
+    if job.status != "done":
+        return JSONResponse({"job_id": job.id, "status": job.status, "error": job.error}, status_code=500)
+    output_path = (job.result or {}).get("output")
+    if not output_path:
+        # Ex.: conversões do /ffmpeg, entregues na própria resposta
+        return JSONResponse({"job_id": job.id, "status": job.status, "error": "Job sem arquivo de saída"}, status_code=404)
+    return FileResponse(output_path, filename=os.path.basename(output_path))
+
+
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    """
+    Cancela um job que ainda está na fila.
+    """
+    job, error = _job_or_404(job_id)
+    if error:
+        return error
+    if not render_scheduler.cancel(job):
+        return JSONResponse({"job_id": job.id, "status": job.status, "error": "Job já iniciado"}, status_code=409)
+    return {"job_id": job.id, "status": job.status}
+
+
 # ========================
 # ❤️ HEALTHCHECK
 # ========================